@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from werkzeug.exceptions import ServiceUnavailable
+from metrics import metrics, stage
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows; admission control is off there
+    fcntl = None
+
+POLL_SECONDS = 0.05
+
+
+def _try_lock(path):
+    """Open and flock a slot file without blocking; returns the open file descriptor or None"""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _try_any(paths):
+    for path in paths:
+        fd = _try_lock(path)
+        if fd is not None:
+            return fd
+    return None
+
+
+class AdmissionControl:
+    """Host-wide cap on concurrent heavy work (rasterizing, image processing, doc.build).
+
+    Every process on the host shares the same slot files in folder: holding an flock on
+    slot-N is holding a work slot, so a crashed process gives its slots back. Request
+    threads first take one of queue_size wait tickets and then wait up to timeout for a
+    slot; with no ticket free, or no slot in time, they get 503 with Retry-After.
+    Background report workers wait as long as it takes and need no ticket, because the
+    job queue already bounds them.
+    """
+
+    def __init__(self, folder, slots, queue_size, timeout, retry_after):
+        self.folder = folder
+        self.slots = slots if fcntl is not None else 0
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.waiting = 0
+        self.running = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        os.makedirs(folder, exist_ok=True)
+        self._slot_paths = [os.path.join(folder, f"slot-{i}.lock") for i in range(slots)]
+        self._ticket_paths = [os.path.join(folder, f"wait-{i}.lock") for i in range(queue_size)]
+
+    def _count(self, name, delta):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + delta)
+
+    def _reject(self, name, reason):
+        metrics.inc('scout_admission_rejections_total', help_text='Heavy work refused with 503, by stage and reason',
+                    stage=name, reason=reason)
+        raise ServiceUnavailable("The server is busy; please try again shortly", retry_after=self.retry_after)
+
+    @contextmanager
+    def background(self):
+        """Let heavy work started by this thread wait for a slot instead of failing"""
+        previous = getattr(self._local, 'background', False)
+        self._local.background = True
+        try:
+            yield
+        finally:
+            self._local.background = previous
+
+    def bind(self, fn):
+        """Wrap fn so it runs with the calling thread's waiting mode, for thread pools"""
+        background = getattr(self._local, 'background', False)
+        def run(*args, **kwargs):
+            self._local.background = background
+            return fn(*args, **kwargs)
+        return run
+
+    @contextmanager
+    def slot(self, name):
+        """Hold one heavy-work slot while the block runs"""
+        if not self.slots or getattr(self._local, 'held', False):
+            # Disabled, or this thread already holds a slot for an enclosing stage
+            yield
+            return
+
+        fd = _try_any(self._slot_paths)
+        if fd is None:
+            fd = self._wait(name)
+        self._local.held = True
+        self._count('running', 1)
+        try:
+            yield
+        finally:
+            self._local.held = False
+            self._count('running', -1)
+            os.close(fd)
+
+    def _wait(self, name):
+        background = getattr(self._local, 'background', False)
+        ticket = None
+        if not background:
+            ticket = _try_any(self._ticket_paths)
+            if ticket is None:
+                self._reject(name, 'queue_full')
+        deadline = None if background else time.monotonic() + self.timeout
+        self._count('waiting', 1)
+        try:
+            with stage('admission_wait'):
+                while True:
+                    time.sleep(POLL_SECONDS)
+                    fd = _try_any(self._slot_paths)
+                    if fd is not None:
+                        return fd
+                    if deadline is not None and time.monotonic() >= deadline:
+                        self._reject(name, 'timeout')
+        finally:
+            self._count('waiting', -1)
+            if ticket is not None:
+                os.close(ticket)
+
+    def stats(self):
+        return {
+            'slots': self.slots,
+            'queue_size': self.queue_size,
+            'waiting': self.waiting,
+            'running': self.running,
+        }
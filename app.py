@@ -1,477 +1,1580 @@
 #!/usr/bin/python3
 
-from flask import Flask, render_template, request, send_file, url_for, redirect
-from werkzeug.utils import secure_filename
-from datetime import datetime, timedelta
+from flask import Flask, render_template, request, send_file, url_for, redirect, jsonify, Response, g
+from werkzeug.utils import secure_filename, send_file as werkzeug_send_file
+from werkzeug.exceptions import HTTPException, BadRequest, ServiceUnavailable
+from datetime import datetime
 from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
-from PIL import Image as PILImage
-from PyPDF2 import PdfReader
+import io
 import os
+import hmac
+import json
+import time
 import uuid
-from pdf2image import convert_from_path
 import sys
+import tempfile
 import logging
 import os
 from pathlib import Path
 import re
+import click
+from functools import wraps, lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from jobqueue import JobQueue, WorkerPool
+from rastercache import RasterCache, file_sha256
+from fragments import FragmentCache
+from uploads import StreamingUploadRequest, SpooledUpload
+from resumable import ResumableUploads
+from scratch import ScratchSpace, QuotaExceeded, move_into
+from admission import AdmissionControl
+from janitor import FileManifest, ExpirySweeper
+from submissions import SubmissionStore, parse_group_by, rows_to_csv
+from zipstream import stream_zip, unique_name
+from reportstore import ReportStore, MemoryReportCache
+from metrics import metrics, stage, stage_error, begin_trace, end_trace
 
 # Get the absolute path of the app directory
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 logging.basicConfig(stream=sys.stderr)
 
+# One JSON line per request and per background report build
+request_log = logging.getLogger('scoutExpenses.requests')
+
+# Uploads, reports, databases and caches live here; the code directory unless SCOUT_STORAGE_ROOT says otherwise
+STORAGE_DIR = os.environ.get('SCOUT_STORAGE_ROOT', BASE_DIR)
+
 app = Flask(__name__)
+app.request_class = StreamingUploadRequest
 app.config['APPLICATION_ROOT'] = '/tools/scoutExpenses'
-app.config['UPLOAD_FOLDER'] = os.path.join(BASE_DIR, 'uploads')
-app.config['REPORT_FOLDER'] = os.path.join(BASE_DIR, 'reports')
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['UPLOAD_FOLDER'] = os.path.join(STORAGE_DIR, 'uploads')
+app.config['REPORT_FOLDER'] = os.path.join(STORAGE_DIR, 'reports')
+app.config['MAX_UPLOAD_FILE_BYTES'] = 16 * 1024 * 1024  # 16MB max per file
+app.config['MAX_UPLOAD_REQUEST_BYTES'] = 48 * 1024 * 1024  # 48MB of files per submission
+app.config['MAX_CONTENT_LENGTH'] = app.config['MAX_UPLOAD_REQUEST_BYTES'] + 1024 * 1024  # plus the form fields
 app.config['ALLOWED_EXTENSIONS'] = {'jpg', 'jpeg', 'png', 'tiff', 'pdf'}
+app.config['DATA_FOLDER'] = os.path.join(STORAGE_DIR, 'data')
+# Receipts the form sends ahead of the submission, in chunks that can be resumed after a dropped connection
+app.config['UPLOAD_SESSION_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], 'partial')
+app.config['UPLOAD_CHUNK_BYTES'] = int(os.environ.get('SCOUT_UPLOAD_CHUNK_KB', '512')) * 1024
+# PDF receipts rasterized at the same time, and poppler processes one report may use in total
+app.config['PDF_RASTER_WORKERS'] = int(os.environ.get('SCOUT_PDF_RASTER_WORKERS', '4'))
+app.config['PDF_RASTER_CPU_BUDGET'] = int(os.environ.get('SCOUT_PDF_RASTER_CPU_BUDGET', str(os.cpu_count() or 1)))
+app.config['PDF_RASTER_DPI'] = 150
+# Rasterized PDFs are rendered a few pages per poppler call, straight to disk, and cut off after a page limit
+app.config['PDF_RASTER_PAGE_WINDOW'] = int(os.environ.get('SCOUT_PDF_RASTER_WINDOW', '4'))
+app.config['PDF_RASTER_MAX_PAGES'] = int(os.environ.get('SCOUT_PDF_MAX_PAGES', '50'))
+app.config['PDF_RASTER_MEMORY_BYTES'] = int(os.environ.get('SCOUT_PDF_RASTER_MEMORY_MB', '256')) * 1024 * 1024
+app.config['RASTER_CACHE_FOLDER'] = os.path.join(STORAGE_DIR, 'cache', 'pages')
+app.config['RASTER_CACHE_MAX_BYTES'] = int(os.environ.get('SCOUT_RASTER_CACHE_MB', '512')) * 1024 * 1024
+# Supporting-document pages rendered per receipt, reused when a report is regenerated or a receipt resubmitted
+app.config['FRAGMENT_CACHE_FOLDER'] = os.path.join(STORAGE_DIR, 'cache', 'fragments')
+app.config['FRAGMENT_CACHE_MAX_BYTES'] = int(os.environ.get('SCOUT_FRAGMENT_CACHE_MB', '512')) * 1024 * 1024
+# Receipt photos are downscaled to this effective DPI for the 6.5" x 7" image box and re-encoded as JPEG
+app.config['NORMALIZE_RECEIPT_IMAGES'] = os.environ.get('SCOUT_NORMALIZE_IMAGES', '1') == '1'
+app.config['RECEIPT_IMAGE_DPI'] = int(os.environ.get('SCOUT_RECEIPT_IMAGE_DPI', '200'))
+app.config['RECEIPT_JPEG_QUALITY'] = 85
+# 'merge' appends the original PDF receipt pages to the report; 'rasterize' embeds them as images
+app.config['RECEIPT_PDF_MODE'] = os.environ.get('SCOUT_RECEIPT_PDF_MODE', 'merge')
+# Draw receipt-free reports from a cached static layout instead of re-flowing them with platypus
+app.config['FAST_RENDERER'] = os.environ.get('SCOUT_FAST_RENDERER', '1') == '1'
+# Build reports on background workers instead of inside the /submit request
+app.config['REPORT_JOBS_ENABLED'] = os.environ.get('SCOUT_REPORT_JOBS', '1') == '1'
+app.config['REPORT_JOB_WORKERS'] = int(os.environ.get('SCOUT_REPORT_JOB_WORKERS', '2'))  # threads per process
+# Each report build gets a private directory here for its intermediates, removed when the build ends.
+# Point SCOUT_SCRATCH_DIR at a tmpfs (e.g. /dev/shm/scout) to keep them off the disk
+app.config['SCRATCH_FOLDER'] = os.environ.get('SCOUT_SCRATCH_DIR', os.path.join(STORAGE_DIR, 'cache', 'scratch'))
+# Disk quotas in bytes (0 = unlimited); new uploads, reports or builds past them get 507 Insufficient Storage
+app.config['UPLOAD_QUOTA_BYTES'] = int(os.environ.get('SCOUT_UPLOAD_QUOTA_MB', '10240')) * 1024 * 1024
+app.config['REPORT_QUOTA_BYTES'] = int(os.environ.get('SCOUT_REPORT_QUOTA_MB', '5120')) * 1024 * 1024
+app.config['SCRATCH_QUOTA_BYTES'] = int(os.environ.get('SCOUT_SCRATCH_QUOTA_MB', '1024')) * 1024 * 1024
+# Heavy work (rasterizing PDFs, processing photos, doc.build) allowed at once on this host, shared by every
+# process through lock files in ADMISSION_FOLDER (a local filesystem). Requests queue for a slot up to
+# ADMISSION_TIMEOUT seconds, at most ADMISSION_QUEUE of them; past that they get 503 with Retry-After
+app.config['ADMISSION_FOLDER'] = os.environ.get('SCOUT_ADMISSION_DIR', os.path.join(app.config['DATA_FOLDER'], 'slots'))
+app.config['ADMISSION_SLOTS'] = int(os.environ.get('SCOUT_HEAVY_SLOTS', str(os.cpu_count() or 1)))  # 0 = no limit
+app.config['ADMISSION_QUEUE'] = int(os.environ.get('SCOUT_HEAVY_QUEUE', '8'))
+app.config['ADMISSION_TIMEOUT'] = float(os.environ.get('SCOUT_HEAVY_WAIT_SECONDS', '10'))
+app.config['ADMISSION_RETRY_AFTER'] = int(os.environ.get('SCOUT_RETRY_AFTER_SECONDS', '5'))
+# Uploads, page images and reports are deleted this long after they were last written
+app.config['FILE_RETENTION_SECONDS'] = 7 * 24 * 60 * 60
+# Seconds between background expiry sweeps; 0 leaves expiry to `flask sweep-expired` from cron
+app.config['EXPIRY_SWEEP_INTERVAL'] = int(os.environ.get('SCOUT_EXPIRY_SWEEP_INTERVAL', '3600'))
+# Shared secret for the /treasurer endpoints; they are disabled while it is empty
+app.config['TREASURER_TOKEN'] = os.environ.get('SCOUT_TREASURER_TOKEN', '')
+# Reports with receipts are rewritten after the build: identical images and fonts stored once, streams
+# recompressed at PDF_COMPRESSION_LEVEL, and with SCOUT_PDF_LINEARIZE=1 linearized by qpdf for fast web view
+app.config['PDF_OPTIMIZE'] = os.environ.get('SCOUT_PDF_OPTIMIZE', '1') == '1'
+app.config['PDF_COMPRESSION_LEVEL'] = 9
+app.config['PDF_LINEARIZE'] = os.environ.get('SCOUT_PDF_LINEARIZE', '0') == '1'
+# Prometheus text-format /metrics endpoint and structured per-request logs
+app.config['METRICS_ENABLED'] = os.environ.get('SCOUT_METRICS', '1') == '1'
+app.config['REQUEST_LOG'] = os.environ.get('SCOUT_REQUEST_LOG', '1') == '1'
+# Load the PDF/imaging stack and render a throwaway report when a process starts (see warm_up)
+app.config['WARM_UP'] = os.environ.get('SCOUT_WARM_UP', '0') == '1'
+
+if app.config['REQUEST_LOG']:
+    request_log.setLevel(logging.INFO)
+
+# Where receipt-free reports go: 'disk' (REPORT_FOLDER, kept for the retention period), 'memory' (built
+# in the request and kept in a bounded in-process LRU for the download page) or 'stream' (sent straight
+# back as the /submit response and not kept). Reports with receipts are always stored on disk.
+app.config['REPORT_STORAGE'] = os.environ.get('SCOUT_REPORT_STORAGE', 'disk')
+app.config['REPORT_MEMORY_MAX_BYTES'] = int(os.environ.get('SCOUT_REPORT_MEMORY_MB', '64')) * 1024 * 1024
+# In 'memory' and 'stream' mode, reports larger than this are built and held in a spill file instead of in RAM
+app.config['REPORT_SPOOL_MAX_BYTES'] = 1024 * 1024
+app.config['REPORT_SPOOL_FOLDER'] = os.path.join(STORAGE_DIR, 'cache', 'spool')
+# Hand report downloads to the front-end server: 'x-sendfile' (Apache mod_xsendfile) or 'x-accel' (nginx)
+app.config['REPORT_SENDFILE'] = os.environ.get('SCOUT_REPORT_SENDFILE', '')
+# nginx internal location that maps onto REPORT_FOLDER, used with 'x-accel'
+app.config['REPORT_ACCEL_PREFIX'] = os.environ.get('SCOUT_REPORT_ACCEL_PREFIX', '/internal-reports/')
+# Reports never change once built, so browsers may keep them this long
+app.config['REPORT_CACHE_SECONDS'] = 24 * 60 * 60
 
 # Create folders if they don't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['REPORT_FOLDER'], exist_ok=True)
+os.makedirs(app.config['DATA_FOLDER'], exist_ok=True)
 
 MILEAGE_RATE = 0.625
 
+REPORT_DOC_KWARGS = {'pagesize': letter, 'topMargin': 0.5*inch, 'bottomMargin': 0.5*inch}
+
+# Part of every receipt fragment's cache key; bump it when the supporting-document layout changes
+FRAGMENT_LAYOUT_VERSION = 2
+
+# File manifest kinds counted against each disk quota
+MANIFEST_AREAS = {'uploads': ('upload', 'upload-session'), 'reports': ('report', 'spool')}
+
+# poppler's working bitmap per pixel, with some headroom over plain RGB
+RASTER_BYTES_PER_PIXEL = 4
+
+raster_cache = RasterCache(app.config['RASTER_CACHE_FOLDER'], app.config['RASTER_CACHE_MAX_BYTES'])
+fragment_cache = FragmentCache(app.config['FRAGMENT_CACHE_FOLDER'], app.config['FRAGMENT_CACHE_MAX_BYTES'])
+scratch_space = ScratchSpace(app.config['SCRATCH_FOLDER'], app.config['SCRATCH_QUOTA_BYTES'])
+admission = AdmissionControl(
+    app.config['ADMISSION_FOLDER'],
+    app.config['ADMISSION_SLOTS'],
+    app.config['ADMISSION_QUEUE'],
+    app.config['ADMISSION_TIMEOUT'],
+    app.config['ADMISSION_RETRY_AFTER']
+)
+file_manifest = FileManifest(os.path.join(app.config['DATA_FOLDER'], 'manifest.db'))
+submission_store = SubmissionStore(os.path.join(app.config['DATA_FOLDER'], 'submissions.db'))
+report_store = ReportStore(os.path.join(app.config['DATA_FOLDER'], 'reports.db'))
+resumable_uploads = ResumableUploads(
+    app.config['UPLOAD_SESSION_FOLDER'],
+    app.config['ALLOWED_EXTENSIONS'],
+    app.config['MAX_UPLOAD_FILE_BYTES'],
+    app.config['UPLOAD_CHUNK_BYTES']
+)
+report_memory = MemoryReportCache(
+    app.config['REPORT_MEMORY_MAX_BYTES'],
+    app.config['REPORT_SPOOL_MAX_BYTES'],
+    app.config['REPORT_SPOOL_FOLDER']
+)
+
+# Running totals for receipt photos normalized by this process
+image_ingest_stats = {'images': 0, 'bytes_saved': 0}
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
+def track_file(path, kind):
+    """Record a stored file in the manifest so the expiry sweep can find it"""
+    file_manifest.record(path, kind, app.config['FILE_RETENTION_SECONDS'])
+
+def record_submission(submission_id, data, signature_data, totals, report_filename, purchase_documents=None, report_id=None):
+    """Index a generated report's data for the treasurer; never fails the report itself"""
+    try:
+        submission_store.record(submission_id, data, signature_data, totals, report_filename,
+                                purchase_documents, report_id)
+    except Exception as e:
+        print(f"Error recording submission {submission_id}: {e}")
+
+def manifest_usage(area):
+    """Bytes recorded in the file manifest for 'uploads' or 'reports'"""
+    by_kind = file_manifest.usage()
+    return sum(by_kind.get(kind, 0) for kind in MANIFEST_AREAS[area])
+
+def disk_usage():
+    """Bytes stored per area: uploads and reports as recorded in the file manifest, caches and scratch measured"""
+    return {
+        'uploads': manifest_usage('uploads'),
+        'reports': manifest_usage('reports'),
+        'cache': raster_cache.stats()['bytes'] + fragment_cache.stats()['bytes'],
+        'scratch': scratch_space.usage(),
+    }
+
+def disk_quotas():
+    return {
+        'uploads': app.config['UPLOAD_QUOTA_BYTES'],
+        'reports': app.config['REPORT_QUOTA_BYTES'],
+        'cache': app.config['RASTER_CACHE_MAX_BYTES'] + app.config['FRAGMENT_CACHE_MAX_BYTES'],
+        'scratch': app.config['SCRATCH_QUOTA_BYTES'],
+    }
+
+def check_quota(area, incoming=0):
+    """Refuse new files for 'uploads' or 'reports' once the area is at its quota"""
+    quota = disk_quotas()[area]
+    if quota and manifest_usage(area) + incoming > quota:
+        metrics.inc('scout_quota_rejections_total', help_text='Uploads and reports refused by a disk quota', area=area)
+        raise QuotaExceeded(f"The {area} storage quota is full; please try again later")
+
+def sweep_expired_files():
+    """Delete the files whose retention has run out, without scanning the folders"""
+    reclaimed = file_manifest.sweep()
+    cutoff = time.time() - app.config['FILE_RETENTION_SECONDS']
+    # Cache entries count as used whenever they are read, so only ones left idle for the retention period go
+    raster_cache.purge(cutoff)
+    fragment_cache.purge(cutoff)
+    # Builds take seconds; a workspace an hour old belongs to a process that died
+    scratch_space.purge(time.time() - 60 * 60)
+    job_queue.purge(cutoff)
+    report_store.purge(cutoff)
+    if reclaimed['files']:
+        app.logger.info(f"Expiry sweep reclaimed {reclaimed['files']} files, {reclaimed['bytes']} bytes")
+    return reclaimed
+
 def cleanup_old_files():
-    """Remove files older than 7 days"""
-    cutoff_date = datetime.now() - timedelta(days=7)
-    
+    """Remove uploads and reports past their retention by scanning the folders (covers files the manifest predates)"""
+    cutoff = time.time() - app.config['FILE_RETENTION_SECONDS']
+    removed = 0
     for folder in [app.config['UPLOAD_FOLDER'], app.config['REPORT_FOLDER']]:
         for filename in os.listdir(folder):
             filepath = os.path.join(folder, filename)
-            if os.path.isfile(filepath):
-                file_time = datetime.fromtimestamp(os.path.getmtime(filepath))
-                if file_time < cutoff_date:
-                    os.remove(filepath)
+            if os.path.isfile(filepath) and os.path.getmtime(filepath) < cutoff:
+                os.remove(filepath)
+                removed += 1
+    return removed
 
-def convert_pdf_to_images(pdf_path, output_folder):
-    """Convert PDF pages to images"""
+def save_upload(file):
+    """Save an uploaded file under its content hash so duplicate uploads are stored once"""
+    extension = secure_filename(file.filename).rsplit('.', 1)[1].lower()
+    if isinstance(file.stream, SpooledUpload):
+        # Already on disk and hashed while the request body was read
+        tmp_path, content_hash = file.stream.detach()
+    else:
+        tmp_path = os.path.join(app.config['UPLOAD_FOLDER'], f".{uuid.uuid4()}.upload")
+        file.save(tmp_path)
+        content_hash = file_sha256(tmp_path)
+    size = os.path.getsize(tmp_path)
     try:
-        images = convert_from_path(pdf_path, dpi=150)
-        image_paths = []
+        check_quota('uploads', size)
+    except QuotaExceeded:
+        os.remove(tmp_path)
+        raise
+    metrics.inc('scout_bytes_ingested_total', size, help_text='Bytes of receipts uploaded')
+    try:
+        return store_upload(tmp_path, content_hash, extension)
+    except ServiceUnavailable:
+        # Too busy to process the photo; the browser sends the form again after Retry-After
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def store_upload(tmp_path, content_hash, extension):
+    """Move a received file to its content-addressed name, normalizing photos on the way"""
+    if extension != 'pdf' and app.config['NORMALIZE_RECEIPT_IMAGES']:
+        normalized_path = ingest_receipt_image(tmp_path, content_hash)
+        if normalized_path:
+            track_file(normalized_path, 'upload')
+            return normalized_path
+    
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{content_hash}.{extension}")
+    if os.path.exists(filepath):
+        os.remove(tmp_path)
+        # Restart the retention clock for the copy we already have
+        os.utime(filepath)
+    else:
+        os.replace(tmp_path, filepath)
+    track_file(filepath, 'upload')
+    return filepath
+
+def ingest_receipt_image(tmp_path, content_hash):
+    """Replace an uploaded photo with a report-sized JPEG, or return None to keep the original"""
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{content_hash}.receipt.jpg")
+    if os.path.exists(filepath):
+        os.remove(tmp_path)
+        os.utime(filepath)
+        return filepath
+    
+    from imaging import normalize_receipt_image
+    try:
+        with admission.slot('normalize_image'), stage('normalize_image'):
+            bytes_saved = normalize_receipt_image(
+                tmp_path, filepath,
+                dpi=app.config['RECEIPT_IMAGE_DPI'],
+                quality=app.config['RECEIPT_JPEG_QUALITY']
+            )
+    except ServiceUnavailable:
+        # The caller decides what happens to the upload
+        raise
+    except Exception as e:
+        print(f"Error normalizing image {tmp_path}: {e}")
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        return None
+    
+    os.remove(tmp_path)
+    image_ingest_stats['images'] += 1
+    image_ingest_stats['bytes_saved'] += bytes_saved
+    app.logger.info(f"Normalized receipt image {os.path.basename(filepath)}: saved {bytes_saved} bytes")
+    return filepath
+
+def raster_plan(page_size, dpi, thread_count):
+    """DPI and pdftoppm process count that keep the page bitmaps being rendered under the memory ceiling"""
+    ceiling = app.config['PDF_RASTER_MEMORY_BYTES']
+    width, height = page_size
+    page_bytes = (width / 72 * dpi) * (height / 72 * dpi) * RASTER_BYTES_PER_PIXEL
+    if page_bytes > ceiling:
+        # A poster-sized page is rendered at a lower resolution rather than blowing the budget
+        dpi = max(1, int(dpi * (ceiling / page_bytes) ** 0.5))
+        page_bytes = (width / 72 * dpi) * (height / 72 * dpi) * RASTER_BYTES_PER_PIXEL
+    # Each pdftoppm process holds one page bitmap at a time
+    processes = max(1, min(thread_count, int(ceiling // page_bytes)))
+    return dpi, processes
+
+def convert_pdf_to_images(pdf_path, output_folder, thread_count=1, dpi=150):
+    """Convert PDF pages to images, a few pages at a time, written by poppler straight to output_folder"""
+    from pdf2image import convert_from_path
+    from pdf_receipts import probe_pdf_pages
+    max_pages = app.config['PDF_RASTER_MAX_PAGES']
+    try:
+        probe = probe_pdf_pages(pdf_path, max_pages)
+        if probe is None:
+            stage_error('rasterize')
+            return []
+        page_count, page_size = probe
+        if page_count > max_pages:
+            print(f"PDF receipt {pdf_path} has {page_count} pages; rasterizing the first {max_pages}")
+            metrics.inc('scout_pdf_pages_skipped_total', page_count - max_pages,
+                        help_text='PDF receipt pages past SCOUT_PDF_MAX_PAGES left out of reports')
+            page_count = max_pages
         
-        for i, image in enumerate(images):
-            image_path = os.path.join(output_folder, f"{uuid.uuid4()}_page{i}.png")
-            image.save(image_path, 'PNG')
-            image_paths.append(image_path)
+        dpi, processes = raster_plan(page_size, dpi, thread_count)
+        window = max(processes, app.config['PDF_RASTER_PAGE_WINDOW'])
+        image_paths = []
+        prefix = uuid.uuid4().hex
+        with admission.slot('rasterize'):
+            for first_page in range(1, page_count + 1, window):
+                last_page = min(first_page + window - 1, page_count)
+                # paths_only leaves the pages on disk instead of decoding them into memory
+                image_paths.extend(convert_from_path(
+                    pdf_path, dpi=dpi, first_page=first_page, last_page=last_page,
+                    output_folder=output_folder, output_file=f"{prefix}_page{first_page:05d}_",
+                    fmt='png', paths_only=True, thread_count=processes
+                ))
         
+        metrics.inc('scout_pages_rasterized_total', len(image_paths), help_text='PDF receipt pages rendered by poppler')
         return image_paths
+    except ServiceUnavailable:
+        raise
     except Exception as e:
         print(f"Error converting PDF: {e}")
+        stage_error('rasterize')
         return []
 
+def cached_pdf_pages(pdf_path, thread_count, work_dir=None):
+    """Page images for a PDF, rendered by poppler only if this content has not been seen before"""
+    dpi = app.config['PDF_RASTER_DPI']
+    pages = raster_cache.get_or_create(
+        pdf_path, dpi, 'png',
+        lambda output_folder: convert_pdf_to_images(pdf_path, output_folder, thread_count, dpi),
+        max_pages=app.config['PDF_RASTER_MAX_PAGES'],
+        work_dir=work_dir
+    )
+    if pages:
+        track_file(os.path.dirname(pages[0]), 'pages')
+    return pages
+
+def rasterize_pdfs(pdf_paths, work_dir=None):
+    """Convert several PDFs at once, returning {pdf_path: [page image paths]} in page order"""
+    pdf_paths = list(dict.fromkeys(pdf_paths))
+    if not pdf_paths:
+        return {}
+    
+    # Documents run side by side; the CPU budget is shared out as pdftoppm processes per document
+    workers = max(1, min(app.config['PDF_RASTER_WORKERS'], len(pdf_paths)))
+    threads_per_pdf = max(1, app.config['PDF_RASTER_CPU_BUDGET'] // workers)
+    
+    # pdf2image shells out to poppler, so threads are enough to keep every core busy
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pdf_path: pool.submit(admission.bind(cached_pdf_pages), pdf_path, threads_per_pdf, work_dir)
+            for pdf_path in pdf_paths
+        }
+        return {pdf_path: future.result() for pdf_path, future in futures.items()}
+
 def sanitize_filename(text):
     """Remove special characters and spaces from filename"""
     # Remove any characters that aren't alphanumeric, hyphen, or underscore
     text = re.sub(r'[^\w\-]', '', text)
     return text
 
-def generate_expense_report(data, purchase_documents, signature_data):
-    """Generate PDF expense report"""
-    report_id = str(uuid.uuid4())
-    
-    # Create sanitized filename
-    last_name = sanitize_filename(data['requestor_last'])
-    event_name = sanitize_filename(data['event_name'])
-    event_date = sanitize_filename(data['event_date'].replace('-', ''))
+def report_values(data, signature_data):
+    """Display strings for the summary pages of a report, plus the numeric totals"""
+    values = {
+        'requestor': f"{data['requestor_first']} {data['requestor_last']}",
+        'email': data['email'],
+        'troop_number': data['troop_number'],
+        'event_name': data['event_name'],
+        'event_date': data['event_date'],
+        'date_created': data['date_created'],
+        'purchase_rows': [],
+        'mileage_rows': []
+    }
     
-    report_filename = f"{last_name}_{event_name}_{event_date}.pdf"
-    report_path = os.path.join(app.config['REPORT_FOLDER'], report_filename)
-    
-    doc = SimpleDocTemplate(report_path, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
-    story = []
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        textColor=colors.HexColor('#000000'),
-        spaceAfter=10,
-        alignment=TA_CENTER
-    )
+    total_purchases = 0.0
+    for purchase in data['purchases']:
+        if purchase['date']:
+            amount = float(purchase['amount']) if purchase['amount'] else 0.0
+            total_purchases += amount
+            values['purchase_rows'].append([
+                purchase['date'],
+                purchase['place'],
+                purchase['items'],
+                f"${amount:.2f}"
+            ])
     
-    warning_style = ParagraphStyle(
-        'WarningStyle',
-        parent=styles['Normal'],
-        fontSize=12,
-        textColor=colors.HexColor('#a70000'),
-        spaceAfter=10,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold'
-    )
+    total_miles = 0.0
+    total_mileage_cost = 0.0
+    for mileage in data['mileage']:
+        if mileage['date']:
+            miles = float(mileage['miles']) if mileage['miles'] else 0.0
+            cost = miles * MILEAGE_RATE
+            total_miles += miles
+            total_mileage_cost += cost
+            values['mileage_rows'].append([
+                mileage['date'],
+                mileage['start'],
+                mileage['destination'],
+                f"{miles:.2f}" if miles else '',
+                f"${cost:.2f}"
+            ])
     
-    header_style = ParagraphStyle(
-        'CustomHeader',
-        parent=styles['Normal'],
-        fontSize=12,
-        spaceAfter=6
-    )
+    grand_total = total_purchases + total_mileage_cost
+    values['purchase_total'] = f"${total_purchases:.2f}"
+    values['miles_total'] = f"{total_miles:.2f}"
+    values['mileage_total'] = f"${total_mileage_cost:.2f}"
+    values['grand_total'] = f"${grand_total:.2f}"
     
-    # Title
-    story.append(Paragraph("TROOP 233/2233 EXPENSE REIMBURSEMENT", title_style))
-    story.append(Spacer(1, 0.1*inch))
+    if signature_data:
+        values['signature_name'] = signature_data['name']
+        values['signature_date'] = signature_data['date']
     
-    # Warning about reimbursement
-    story.append(Paragraph("⚠️ IMPORTANT: Reimbursement will go to Requestor's account", warning_style))
-    story.append(Spacer(1, 0.1*inch))
+    totals = {
+        'purchases': total_purchases,
+        'miles': total_miles,
+        'mileage': total_mileage_cost,
+        'grand': grand_total
+    }
+    return values, totals
+
+def build_summary_story(values, reason):
+    """Flowables for the summary and signature pages; reason is the flowable for the description cell"""
+    from reportlab.platypus import Table, Spacer
+    from report_template import get_report_template
+    story = []
+    template = get_report_template()
     
-    story.append(Paragraph("NEXT STEPS: You MUST email this expense report to the treasurer through Troopweb Host in order to be reimbursed.", title_style))
-    story.append(Spacer(1, 0.2*inch))
+    # Title, reimbursement warning and next steps
+    story.extend(template.heading())
     
     # Event Information
-    requestor_name = f"{data['requestor_first']} {data['requestor_last']}"
     event_data = [
-        ['Requestor:', requestor_name],
-        ['Email:', data['email']],
-        ['Troop #:', data['troop_number']],
-        ['Event Name:', data['event_name']],
-        ['Event Date:', data['event_date']],
-        ['Reason / Description:', Paragraph(data['reason'], header_style)],
-        ['Date Created:', data['date_created']]
+        ['Requestor:', values['requestor']],
+        ['Email:', values['email']],
+        ['Troop #:', values['troop_number']],
+        ['Event Name:', values['event_name']],
+        ['Event Date:', values['event_date']],
+        ['Reason / Description:', reason],
+        ['Date Created:', values['date_created']]
     ]
     
-    event_table = Table(event_data, colWidths=[2*inch, 4.5*inch])
-    event_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('LEFTPADDING', (0, 0), (-1, -1), 6),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-    ]))
+    event_table = Table(event_data, colWidths=template.event_col_widths)
+    event_table.setStyle(template.event_table_style)
 
     story.append(event_table)
     story.append(Spacer(1, 0.2*inch))
     
     # Purchases Table
     purchase_data = [['Date Purchased', 'Place Purchased', 'Items Purchased', '$ Amount']]
-    total_purchases = 0.0
-    
-    for purchase in data['purchases']:
-        if purchase['date']:
-            amount = float(purchase['amount']) if purchase['amount'] else 0.0
-            total_purchases += amount
-            purchase_data.append([
-                purchase['date'],
-                purchase['place'],
-                purchase['items'],
-                f"${amount:.2f}"
-            ])
+    purchase_data.extend(values['purchase_rows'])
     
     # Add empty row if no purchases
     if len(purchase_data) == 1:
         purchase_data.append(['', '', '', ''])
     
-    purchase_data.append(['', '', 'Total All Items Purchased', f"${total_purchases:.2f}"])
-    
-    purchase_table = Table(purchase_data, colWidths=[1.2*inch, 1.8*inch, 3*inch, 1*inch])
-    purchase_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
+    purchase_data.append(['', '', 'Total All Items Purchased', values['purchase_total']])
+    
+    purchase_table = Table(purchase_data, colWidths=template.purchase_col_widths)
+    purchase_table.setStyle(template.line_item_table_style)
     story.append(purchase_table)
     story.append(Spacer(1, 0.2*inch))
     
     # Mileage Table
     mileage_data = [['Date', 'Start Location', 'Destination', 'Miles', f'Total x ${MILEAGE_RATE}/Mi']]
-    total_miles = 0.0
-    total_mileage_cost = 0.0
-    
-    for mileage in data['mileage']:
-        if mileage['date']:
-            miles = float(mileage['miles']) if mileage['miles'] else 0.0
-            cost = miles * MILEAGE_RATE
-            total_miles += miles
-            total_mileage_cost += cost
-            mileage_data.append([
-                mileage['date'],
-                mileage['start'],
-                mileage['destination'],
-                f"{miles:.2f}" if miles else '',
-                f"${cost:.2f}"
-            ])
+    mileage_data.extend(values['mileage_rows'])
     
     # Add empty row if no mileage
     if len(mileage_data) == 1:
         mileage_data.append(['', '', '', '', ''])
     
-    mileage_data.append(['', '', 'All Miles Total', f"{total_miles:.2f}", f"${total_mileage_cost:.2f}"])
-    
-    mileage_table = Table(mileage_data, colWidths=[1*inch, 1.8*inch, 1.8*inch, 0.8*inch, 1.6*inch])
-    mileage_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-    ]))
+    mileage_data.append(['', '', 'All Miles Total', values['miles_total'], values['mileage_total']])
+    
+    mileage_table = Table(mileage_data, colWidths=template.mileage_col_widths)
+    mileage_table.setStyle(template.line_item_table_style)
     story.append(mileage_table)
     story.append(Spacer(1, 0.2*inch))
     
     # Grand Total
-    grand_total = total_purchases + total_mileage_cost
-    total_data = [['Grand Total Amount', f"${grand_total:.2f}"]]
-    total_table = Table(total_data, colWidths=[5*inch, 2*inch])
-    total_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, -1), colors.lightgrey),
-        ('ALIGN', (0, 0), (0, 0), 'RIGHT'),
-        ('ALIGN', (1, 0), (1, 0), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 12),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('TOPPADDING', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
-    ]))
+    total_data = [['Grand Total Amount', values['grand_total']]]
+    total_table = Table(total_data, colWidths=template.total_col_widths)
+    total_table.setStyle(template.total_table_style)
     story.append(total_table)
     story.append(Spacer(1, 0.3*inch))
     
     # Signature Section
-    if signature_data:
-        signature_style = ParagraphStyle(
-            'SignatureStyle',
-            parent=styles['Normal'],
-            fontSize=11,
-            spaceAfter=8
-        )
-        
-        story.append(Paragraph("SIGNATURE AND ACKNOWLEDGMENT", title_style))
-        story.append(Spacer(1, 0.15*inch))
-        
-        story.append(Paragraph("By submitting this expense reimbursement report, I affirm that:", signature_style))
-        story.append(Paragraph("• All information provided is true, honest, and accurate to the best of my knowledge", signature_style))
-        story.append(Paragraph("• All expenses listed were incurred for legitimate Troop 233/2233 activities", signature_style))
-        story.append(Paragraph("• I have provided accurate receipts and supporting documentation", signature_style))
-        story.append(Paragraph("• I understand this submission is made in accordance with the Scout Law", signature_style))
-        story.append(Spacer(1, 0.15*inch))
-        
-        scout_law_text = "<b>Scout Law:</b> <i>A Scout is Trustworthy, Loyal, Helpful, Friendly, Courteous, Kind, Obedient, Cheerful, Thrifty, Brave, Clean, and Reverent.</i>"
-        story.append(Paragraph(scout_law_text, signature_style))
-        story.append(Spacer(1, 0.2*inch))
+    if 'signature_name' in values:
+        # Affirmation paragraphs and the Scout Law
+        story.extend(template.affirmation())
         
         # Signature table
         signature_table_data = [
-            ['Electronic Signature:', signature_data['name']],
-            ['Date Signed:', signature_data['date']],
+            ['Electronic Signature:', values['signature_name']],
+            ['Date Signed:', values['signature_date']],
             ['Acknowledgment:', 'Confirmed in accordance with Scout Law']
         ]
         
-        sig_table = Table(signature_table_data, colWidths=[2*inch, 4.5*inch])
-        sig_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-            ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-            ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTNAME', (1, 0), (1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('LEFTPADDING', (0, 0), (-1, -1), 8),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-            ('TOPPADDING', (0, 0), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ]))
+        sig_table = Table(signature_table_data, colWidths=template.signature_col_widths)
+        sig_table.setStyle(template.signature_table_style)
         story.append(sig_table)
     
-    # Supporting Documents - organized by purchase
-    if purchase_documents:
-        story.append(PageBreak())
-        story.append(Paragraph("SUPPORTING DOCUMENTS", title_style))
-        story.append(Spacer(1, 0.2*inch))
+    return story
+
+@lru_cache(maxsize=None)
+def get_fast_renderer():
+    """The process-wide fast renderer, created on first use"""
+    from fast_report import FastReportRenderer
+    return FastReportRenderer(build_summary_story, REPORT_DOC_KWARGS)
+
+def store_report(report_id, report_path, report_filename, renderer, data, signature_data, totals, output=None,
+                 purchase_documents=None, submission_id=None):
+    """Book-keeping for a finished report: download metadata, expiry, metrics and the submission index"""
+    if output is None:
+        report_store.register(report_id, report_path, report_filename, submission_id)
+        track_file(report_path, 'report')
+        size = os.path.getsize(report_path)
+    else:
+        size = output.tell()
+    metrics.inc('scout_reports_total', help_text='Reports generated, by renderer', renderer=renderer)
+    metrics.inc('scout_bytes_produced_total', size, help_text='Bytes of PDF reports written')
+    record_submission(submission_id or report_id, data, signature_data, totals, report_filename,
+                      purchase_documents, report_id)
+
+def receipt_header(purchase_index, purchase):
+    return f"Purchase #{purchase_index + 1}: {purchase['items']} - ${purchase['amount']}"
+
+def scaled_image(image_path, max_width, max_height):
+    """A report Image flowable for a picture, shrunk to fit the receipt box"""
+    from reportlab.platypus import Image
+    from PIL import Image as PILImage
+    with stage('image_probe'):
+        img = PILImage.open(image_path)
+        img_width, img_height = img.size
+    
+    aspect = img_height / float(img_width)
+    if img_width > max_width:
+        img_width = max_width
+        img_height = img_width * aspect
+    
+    if img_height > max_height:
+        img_height = max_height
+        img_width = img_height / aspect
+    
+    return Image(image_path, width=img_width, height=img_height)
+
+def build_receipt_fragment(fragment_path, header, file_path, with_title, merge_page_count, page_images, omitted_pages=0):
+    """Render the supporting-document pages for one receipt as a standalone PDF"""
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+    from report_template import get_report_template
+    from pdf_receipts import ReceiptMarker, merge_pdf_receipts
+    
+    template = get_report_template()
+    story = []
+    if with_title:
+        story.extend(template.supporting_documents_title())
+    story.append(Paragraph(header, template.purchase_header_style))
+    
+    marker = None
+    try:
+        # Handle images
+        if file_path.lower().endswith(('.jpg', '.jpeg', '.png', '.tiff')):
+            story.append(scaled_image(file_path, 6.5 * inch, 7 * inch))
+            story.append(Spacer(1, 0.3*inch))
+        
+        # Original PDF pages are spliced in after this separator page
+        elif merge_page_count:
+            story.append(Paragraph(
+                f"Original PDF receipt attached on the following {merge_page_count} page{'s' if merge_page_count != 1 else ''}.",
+                template.header_style
+            ))
+            marker = ReceiptMarker(file_path)
+            story.append(marker)
         
-        # Iterate through purchases and their documents
-        for purchase_index, purchase in enumerate(data['purchases']):
-            if purchase['date'] and purchase_index in purchase_documents:
-                # Add purchase info header
-                purchase_header = f"Purchase #{purchase_index + 1}: {purchase['items']} - ${purchase['amount']}"
-                purchase_header_para = Paragraph(purchase_header, ParagraphStyle(
-                    'PurchaseHeader',
-                    parent=styles['Normal'],
-                    fontSize=12,
-                    fontName='Helvetica-Bold',
-                    textColor=colors.HexColor('#003f87'),
-                    spaceAfter=10
+        # Handle PDFs converted to images
+        elif file_path.lower().endswith('.pdf'):
+            for pdf_img in page_images:
+                story.append(scaled_image(pdf_img, 6.5 * inch, 7 * inch))
+                story.append(Spacer(1, 0.2*inch))
+            if omitted_pages:
+                story.append(Paragraph(
+                    f"{omitted_pages} more page{'s' if omitted_pages != 1 else ''} of this PDF "
+                    f"{'were' if omitted_pages != 1 else 'was'} left out; the original file is kept with the submission.",
+                    template.header_style
                 ))
-                story.append(purchase_header_para)
-                
-                file_path = purchase_documents[purchase_index]
-                try:
-                    # Handle images
-                    if file_path.lower().endswith(('.jpg', '.jpeg', '.png', '.tiff')):
-                        img = PILImage.open(file_path)
-                        img_width, img_height = img.size
-                        
-                        # Scale image to fit page
-                        max_width = 6.5 * inch
-                        max_height = 7 * inch
-                        
-                        aspect = img_height / float(img_width)
-                        if img_width > max_width:
-                            img_width = max_width
-                            img_height = img_width * aspect
-                        
-                        if img_height > max_height:
-                            img_height = max_height
-                            img_width = img_height / aspect
-                        
-                        story.append(Image(file_path, width=img_width, height=img_height))
-                        story.append(Spacer(1, 0.3*inch))
-                    
-                    # Handle PDFs converted to images
-                    elif file_path.lower().endswith('.pdf'):
-                        pdf_images = convert_pdf_to_images(file_path, app.config['UPLOAD_FOLDER'])
-                        for pdf_img in pdf_images:
-                            img = PILImage.open(pdf_img)
-                            img_width, img_height = img.size
-                            
-                            max_width = 6.5 * inch
-                            max_height = 7 * inch
-                            
-                            aspect = img_height / float(img_width)
-                            if img_width > max_width:
-                                img_width = max_width
-                                img_height = img_width * aspect
-                            
-                            if img_height > max_height:
-                                img_height = max_height
-                                img_width = img_height / aspect
-                            
-                            story.append(Image(pdf_img, width=img_width, height=img_height))
-                            story.append(Spacer(1, 0.2*inch))
-                except Exception as e:
-                    print(f"Error adding file {file_path}: {e}")
-                
-                # Add page break between purchases if not the last one
-                if purchase_index < len([p for p in data['purchases'] if p['date']]) - 1:
-                    story.append(PageBreak())
-    
-    # Build PDF
-    doc.build(story)
+    except Exception as e:
+        print(f"Error adding file {file_path}: {e}")
+        stage_error('receipt')
+    
+    with admission.slot('doc_build'), stage('doc_build'):
+        SimpleDocTemplate(fragment_path, **REPORT_DOC_KWARGS).build(story)
+    if marker is not None:
+        with stage('pdf_merge'):
+            merge_pdf_receipts(fragment_path, [marker])
+
+def receipt_fragments(receipts, work_dir=None):
+    """Cached supporting-document PDFs for [(purchase_index, purchase, file_path)], rendering only new ones.
+
+    Returns (fragment paths, number rendered). New page images and fragments are rendered in
+    work_dir when one is given, and new fragments are optimized before they are cached.
+    """
+    from pdf_receipts import count_pdf_pages, probe_pdf_pages
+    
+    keys = []
+    paths = {}
+    missing = {}
+    for position, (purchase_index, purchase, file_path) in enumerate(receipts):
+        header = receipt_header(purchase_index, purchase)
+        # Everything that changes how the pages look; the first receipt also carries the section title
+        key = fragment_cache.key(
+            file_path,
+            header=header,
+            title=position == 0,
+            pdf_mode=app.config['RECEIPT_PDF_MODE'],
+            dpi=app.config['PDF_RASTER_DPI'],
+            max_pages=app.config['PDF_RASTER_MAX_PAGES'],
+            compression=app.config['PDF_COMPRESSION_LEVEL'] if app.config['PDF_OPTIMIZE'] else None,
+            version=FRAGMENT_LAYOUT_VERSION
+        )
+        keys.append(key)
+        if key not in paths and key not in missing:
+            paths[key] = fragment_cache.get(key)
+            if paths[key] is None:
+                missing[key] = (header, file_path, position == 0)
+    
+    if missing:
+        pdf_receipts = [file_path for _, file_path, _ in missing.values() if file_path.lower().endswith('.pdf')]
+        
+        # Well-formed PDFs are merged page for page; only the rest are rasterized
+        merge_page_counts = {}
+        if app.config['RECEIPT_PDF_MODE'] == 'merge':
+            with stage('pdf_inspect'):
+                for path in pdf_receipts:
+                    page_count = count_pdf_pages(path)
+                    if page_count:
+                        merge_page_counts[path] = page_count
+        
+        # Rasterize every remaining PDF up front instead of one at a time
+        with stage('rasterize'):
+            pdf_pages = rasterize_pdfs([path for path in pdf_receipts if path not in merge_page_counts], work_dir)
+        
+        # A PDF that reached the page limit may have had pages cut off
+        omitted = {}
+        for path, pages in pdf_pages.items():
+            if pages and len(pages) >= app.config['PDF_RASTER_MAX_PAGES']:
+                probe = probe_pdf_pages(path, 1)
+                if probe and probe[0] > len(pages):
+                    omitted[path] = probe[0] - len(pages)
+        
+        for key, (header, file_path, with_title) in missing.items():
+            paths[key] = fragment_cache.put(key, lambda fragment_path: render_fragment(
+                key, fragment_path, header, file_path, with_title,
+                merge_page_counts.get(file_path), pdf_pages.get(file_path, []), omitted.get(file_path, 0)
+            ), work_dir)
+    
+    for path in set(paths.values()):
+        track_file(path, 'fragment')
+    return [paths[key] for key in keys], len(missing)
+
+def render_fragment(key, fragment_path, *layout):
+    """Build a receipt fragment and optimize it once, so every report that reuses it gets the smaller copy"""
+    build_receipt_fragment(fragment_path, *layout)
+    if app.config['PDF_OPTIMIZE']:
+        optimize_report(f"fragment {key[:12]}", fragment_path, linearize_output=False)
+
+def optimize_report(report_id, report_path, recompress=True, linearize_output=None):
+    """Post-build size optimization; a failure leaves the report as built.
+
+    recompress=False only stores identical streams once, for reports joined from fragments that
+    were already recompressed when they were cached.
+    """
+    from pdf_optimize import optimize_pdf, linearize
+    if linearize_output is None:
+        linearize_output = app.config['PDF_LINEARIZE']
+    try:
+        with stage('pdf_optimize'):
+            if app.config['PDF_OPTIMIZE']:
+                result = optimize_pdf(
+                    report_path,
+                    compression_level=app.config['PDF_COMPRESSION_LEVEL'],
+                    linearize_output=linearize_output,
+                    recompress=recompress
+                )
+            else:
+                before = os.path.getsize(report_path)
+                linearized = linearize(report_path) if linearize_output else False
+                result = {'before': before, 'after': os.path.getsize(report_path), 'duplicates': 0,
+                          'recompressed_bytes': 0, 'linearized': linearized}
+    except Exception as e:
+        print(f"Error optimizing report {report_id}: {e}")
+        return None
+    
+    metrics.inc('scout_pdf_optimize_bytes_saved_total', result['before'] - result['after'],
+                help_text='Bytes removed from reports by the post-build optimization')
+    app.logger.info(
+        f"Optimized report {report_id}: {result['before']} -> {result['after']} bytes, "
+        f"{result['duplicates']} duplicate objects, linearized={result['linearized']}"
+    )
+    return result
+
+def report_buffer():
+    """File object to build an in-memory-mode report in: RAM up to REPORT_SPOOL_MAX_BYTES, a temporary file past that"""
+    os.makedirs(app.config['REPORT_SPOOL_FOLDER'], exist_ok=True)
+    return tempfile.SpooledTemporaryFile(max_size=app.config['REPORT_SPOOL_MAX_BYTES'],
+                                         dir=app.config['REPORT_SPOOL_FOLDER'])
+
+def generate_expense_report(data, purchase_documents, signature_data, output=None, submission_id=None):
+    """Generate PDF expense report; a receipt-free report can be written to an output file object instead of REPORT_FOLDER.
+
+    Passing submission_id regenerates an edited submission: a new report is built and recorded under the
+    existing submission. Receipt pages come from the fragment cache, so only changed ones are rendered.
+    """
+    # The PDF and imaging stack loads on the first report, not when a web process starts
+    from reportlab.platypus import SimpleDocTemplate, Paragraph
+    from report_template import get_report_template
+    from pdf_receipts import concatenate_pdfs
+    
+    report_id = str(uuid.uuid4())
+    
+    # Create sanitized filename
+    last_name = sanitize_filename(data['requestor_last'])
+    event_name = sanitize_filename(data['event_name'])
+    event_date = sanitize_filename(data['event_date'].replace('-', ''))
+    
+    # Stored by id so reports with the same friendly name never overwrite each other
+    report_filename = f"{last_name}_{event_name}_{event_date}.pdf"
+    report_path = os.path.join(app.config['REPORT_FOLDER'], f"{report_id}.pdf")
+    
+    template = get_report_template()
+    header_style = template.header_style
+    values, totals = report_values(data, signature_data)
+    
+    receipts = [
+        (purchase_index, purchase, purchase_documents[purchase_index])
+        for purchase_index, purchase in enumerate(data['purchases'])
+        if purchase['date'] and purchase_index in purchase_documents
+    ]
+    if output is not None and receipts:
+        # Receipt fragments are joined into the file on disk
+        raise ValueError("Reports with receipts are always written to REPORT_FOLDER")
+    
+    # The summary and signature pages are drawn on their own; receipt pages are appended after them
+    summary = io.BytesIO() if receipts else (output or report_path)
+    renderer = 'platypus'
+    rendered = False
+    if app.config['FAST_RENDERER']:
+        with stage('fast_render'):
+            rendered = get_fast_renderer().render(summary, values, Paragraph(data['reason'], header_style))
+        if rendered:
+            renderer = 'fast'
+    
+    if not rendered:
+        if not isinstance(summary, str):
+            summary.seek(0)
+            summary.truncate()
+        doc = SimpleDocTemplate(summary, **REPORT_DOC_KWARGS)
+        with admission.slot('doc_build'), stage('doc_build'):
+            doc.build(build_summary_story(values, Paragraph(data['reason'], header_style)))
+    
+    if receipts:
+        # Intermediates live in a private workspace that is removed as soon as the report is in place
+        with scratch_space.workspace() as work_dir:
+            fragment_paths, rendered_fragments = receipt_fragments(receipts, work_dir)
+            build_path = os.path.join(work_dir, 'report.pdf')
+            summary.seek(0)
+            with stage('pdf_merge'):
+                concatenate_pdfs([summary] + fragment_paths, build_path)
+            fragment_cache.evict()
+            if app.config['PDF_OPTIMIZE'] or app.config['PDF_LINEARIZE']:
+                # A regeneration served entirely from the fragment cache only needs shared photos deduplicated
+                optimize_report(report_id, build_path, recompress=rendered_fragments > 0)
+            move_into(build_path, report_path)
+    
+    store_report(report_id, report_path, report_filename, renderer, data, signature_data, totals, output,
+                 purchase_documents=purchase_documents, submission_id=submission_id)
     return report_id, report_filename
 
+# Throwaway submission rendered by warm_up(); never written to disk or the submission store
+WARM_UP_DATA = {
+    'requestor_first': 'Warm', 'requestor_last': 'Up', 'email': '', 'troop_number': '233',
+    'event_name': 'Warm-up', 'event_date': '2026-01-01', 'reason': 'Warm-up', 'date_created': '2026-01-01',
+    'purchases': [{'date': '2026-01-01', 'place': 'Store', 'items': 'Supplies', 'amount': '1.00'}],
+    'mileage': [{'date': '2026-01-01', 'start': 'Home', 'destination': 'Camp', 'miles': '1'}],
+}
+
+def warm_up():
+    """Import the PDF/imaging stack and render a report in memory so the first real submission is fast"""
+    start = time.perf_counter()
+    import PIL.Image
+    import PyPDF2
+    import pdf2image
+    import imaging
+    import pdf_receipts
+    from reportlab.platypus import SimpleDocTemplate, Paragraph
+    from report_template import get_report_template
+    
+    PIL.Image.init()
+    header_style = get_report_template().header_style
+    values, _ = report_values(WARM_UP_DATA, {'name': 'Warm Up', 'date': 'January 01, 2026 at 12:00 AM'})
+    # Records the fast renderer's layout for the most common shape, then exercises platypus and fonts
+    get_fast_renderer().render(io.BytesIO(), values, Paragraph(WARM_UP_DATA['reason'], header_style))
+    SimpleDocTemplate(io.BytesIO(), **REPORT_DOC_KWARGS).build(
+        build_summary_story(values, Paragraph(WARM_UP_DATA['reason'], header_style))
+    )
+    seconds = time.perf_counter() - start
+    app.logger.info(f"Warm-up finished in {seconds:.3f}s")
+    return seconds
+
+expiry_sweeper = ExpirySweeper(sweep_expired_files, app.config['EXPIRY_SWEEP_INTERVAL'])
+
+@app.before_request
+def start_expiry_sweeper():
+    if app.config['EXPIRY_SWEEP_INTERVAL'] > 0:
+        expiry_sweeper.start()
+
+@app.before_request
+def start_request_trace():
+    g.request_start = time.perf_counter()
+    g.request_id = uuid.uuid4().hex[:12]
+    begin_trace()
+
+@app.after_request
+def finish_request_trace(response):
+    seconds = time.perf_counter() - g.get('request_start', time.perf_counter())
+    endpoint = request.endpoint or 'unknown'
+    metrics.observe('scout_request_seconds', seconds, help_text='Request latency by endpoint', endpoint=endpoint)
+    metrics.inc('scout_requests_total', help_text='Requests by endpoint and status', endpoint=endpoint, status=response.status_code)
+    stages = end_trace()
+    if endpoint != 'metrics_endpoint':
+        request_log.info(json.dumps({
+            'event': 'request',
+            'request_id': g.get('request_id'),
+            'method': request.method,
+            'path': request.path,
+            'endpoint': endpoint,
+            'status': response.status_code,
+            'seconds': round(seconds, 6),
+            'bytes_in': request.content_length or 0,
+            'bytes_out': response.content_length or 0,
+            'stages': stages,
+        }))
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Counters and latency histograms for Prometheus (per process)"""
+    if not app.config['METRICS_ENABLED']:
+        return "Metrics are not enabled", 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def render_expense_form(edit=None):
+    # The form shrinks photos to the report's 6.5" x 7" receipt box before sending them
+    dpi = app.config['RECEIPT_IMAGE_DPI']
+    return render_template(
+        'expense_form.html',
+        receipt_max_width=int(6.5 * dpi),
+        receipt_max_height=int(7 * dpi),
+        receipt_jpeg_quality=app.config['RECEIPT_JPEG_QUALITY'] / 100,
+        edit=edit
+    )
+
 @app.route('/')
 def index():
-    cleanup_old_files()
-    return render_template('expense_form.html')
+    return render_expense_form()
+
+@app.route('/edit/<submission_id>')
+def edit_submission(submission_id):
+    """The expense form filled in from an earlier submission, keeping the receipts that are still stored"""
+    stored = submission_store.get(submission_id)
+    if stored is None:
+        return "Submission not found", 404
+    documents = stored.get('purchase_documents') or {}
+    return render_expense_form(edit={
+        'submission_id': submission_id,
+        'data': stored['data'],
+        'signature_name': (stored.get('signature_data') or {}).get('name', ''),
+        # Only which purchases have a receipt on file; paths never leave the server
+        'receipts': [int(index) for index, path in documents.items() if os.path.exists(path)],
+    })
+
+def upload_error(e, upload_id=None):
+    """JSON body for a failed upload call, with the resume offset when the session still exists"""
+    body = {'error': e.description}
+    if upload_id:
+        try:
+            body.update(resumable_uploads.status(upload_id))
+        except HTTPException:
+            pass
+    # Keeps Retry-After on a 503
+    headers = [(name, value) for name, value in e.get_headers() if name != 'Content-Type']
+    return jsonify(body), e.code, headers
+
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    """Start a chunked receipt upload: JSON {filename, size, sha256}"""
+    payload = request.get_json(silent=True) or {}
+    try:
+        if isinstance(payload.get('size'), int):
+            check_quota('uploads', payload['size'])
+        info = resumable_uploads.create(secure_filename(payload.get('filename', '')), payload.get('size'), payload.get('sha256'))
+    except HTTPException as e:
+        return upload_error(e)
+    for path in resumable_uploads.session_files(info['upload_id']):
+        track_file(path, 'upload-session')
+    return jsonify(info), 201
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """How much of an upload the server holds, so the browser can resume from there"""
+    try:
+        return jsonify(resumable_uploads.status(upload_id))
+    except HTTPException as e:
+        return upload_error(e)
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Append the request body at ?offset=N; the last chunk verifies the hash and stores the receipt"""
+    try:
+        offset = request.args.get('offset', type=int)
+        if offset is None:
+            return jsonify({'error': 'offset is required'}), 400
+        with stage('upload_chunk'):
+            received = resumable_uploads.write_chunk(upload_id, offset, request.stream, request.content_length)
+        metrics.inc('scout_bytes_ingested_total', received - offset, help_text='Bytes of receipts uploaded')
+        info = resumable_uploads.status(upload_id)
+        if info['received'] == info['size'] and not info['complete']:
+            with stage('save_upload'):
+                resumable_uploads.complete(upload_id, store_upload)
+            info = resumable_uploads.status(upload_id)
+        return jsonify(info)
+    except HTTPException as e:
+        return upload_error(e, upload_id)
+
+def collect_submission(form, files, previous_documents=None):
+    """Read the expense form into report data, saving uploaded documents.
+
+    previous_documents are the receipts of the submission being edited, keyed by purchase index as a string;
+    a purchase_keep_N field reuses one of them instead of a new upload.
+    """
+    data = {
+        'requestor_first': form.get('requestor_first', ''),
+        'requestor_last': form.get('requestor_last', ''),
+        'email': form.get('email', ''),
+        'troop_number': form.get('troop_number', ''),
+        'event_name': form.get('event_name', ''),
+        'event_date': form.get('event_date', ''),
+        'reason': form.get('reason', ''),
+        'date_created': form.get('date_created', ''),
+        'purchases': [],
+        'mileage': []
+    }
+    
+    # Collect signature data
+    signature_data = {
+        'name': form.get('signature_name', ''),
+        'date': datetime.now().strftime('%B %d, %Y at %I:%M %p'),
+        'acknowledgment': form.get('signature_acknowledgment', '') == 'on'
+    }
+    
+    # Dictionary to store purchase documents mapped to their index
+    purchase_documents = {}
+    
+    # Collect purchase data and associated files
+    i = 0
+    while True:
+        date = form.get(f'purchase_date_{i}', None)
+        if date is None:
+            break
+        
+        if date:  # Only add if date is provided
+            data['purchases'].append({
+                'date': date,
+                'place': form.get(f'purchase_place_{i}', ''),
+                'items': form.get(f'items_summary_{i}', ''),
+                'amount': form.get(f'purchase_amount_{i}', '')
+            })
+            
+            # Handle file upload for this specific purchase
+            file_key = f'purchase_doc_{i}'
+            receipt_id = form.get(f'purchase_receipt_{i}', '')
+            keep_index = form.get(f'purchase_keep_{i}', '')
+            file = files.get(file_key)
+            if file and file.filename and allowed_file(file.filename):
+                with stage('save_upload'):
+                    filepath = save_upload(file)
+                # Map the file to this purchase index
+                purchase_documents[len(data['purchases']) - 1] = filepath
+            elif receipt_id:
+                # Sent ahead of the form through /uploads
+                filepath = resumable_uploads.receipt_path(receipt_id)
+                if filepath is None:
+                    raise BadRequest(f"Receipt upload {receipt_id} is missing or unfinished; please attach it again")
+                track_file(filepath, 'upload')
+                purchase_documents[len(data['purchases']) - 1] = filepath
+            elif keep_index and previous_documents is not None:
+                filepath = previous_documents.get(keep_index)
+                if filepath is None or not os.path.exists(filepath):
+                    raise BadRequest(f"The receipt for purchase #{i + 1} is no longer stored; please attach it again")
+                track_file(filepath, 'upload')
+                purchase_documents[len(data['purchases']) - 1] = filepath
+        i += 1
+    
+    # Collect mileage data (dynamic number of rows)
+    i = 0
+    while True:
+        date = form.get(f'mileage_date_{i}', None)
+        if date is None:
+            break
+        
+        if date:  # Only add if date is provided
+            data['mileage'].append({
+                'date': date,
+                'start': form.get(f'mileage_start_{i}', ''),
+                'destination': form.get(f'mileage_dest_{i}', ''),
+                'miles': form.get(f'mileage_miles_{i}', '')
+            })
+        i += 1
+    
+    return data, purchase_documents, signature_data
+
+def run_report_job(payload):
+    """Worker entry point: build the report described by a queued job"""
+    # JSON object keys are strings; purchase documents are keyed by index
+    purchase_documents = {int(k): v for k, v in payload['purchase_documents'].items()}
+    begin_trace()
+    start = time.perf_counter()
+    status = 'error'
+    try:
+        # Queued jobs wait for a heavy-work slot rather than fail with 503
+        with admission.background(), stage('generate_report'):
+            report_id, report_filename = generate_expense_report(
+                payload['data'], purchase_documents, payload['signature_data'],
+                submission_id=payload.get('submission_id')
+            )
+        status = 'done'
+    finally:
+        request_log.info(json.dumps({
+            'event': 'report_job',
+            'status': status,
+            'seconds': round(time.perf_counter() - start, 6),
+            'receipts': len(purchase_documents),
+            'stages': end_trace(),
+        }))
+    return {'report_id': report_id, 'filename': report_filename, 'submission_id': payload.get('submission_id') or report_id}
+
+job_queue = JobQueue(os.path.join(app.config['DATA_FOLDER'], 'jobs.db'))
+report_workers = WorkerPool(job_queue, run_report_job, workers=app.config['REPORT_JOB_WORKERS'])
+
+# Read when /metrics is scraped
+metrics.gauge('scout_job_queue_depth', job_queue.depth, help_text='Report jobs waiting for a worker')
+metrics.gauge('scout_raster_cache', lambda: {
+    (('field', key),): value for key, value in raster_cache.stats().items()
+}, help_text='Page image cache hits, misses, evictions, entries and bytes')
+metrics.gauge('scout_fragment_cache', lambda: {
+    (('field', key),): value for key, value in fragment_cache.stats().items()
+}, help_text='Receipt fragment cache hits, misses, evictions, entries and bytes')
+metrics.gauge('scout_report_memory', lambda: {
+    (('field', key),): value for key, value in report_memory.stats().items()
+}, help_text='In-memory report cache entries and bytes')
+metrics.gauge('scout_disk_usage_bytes', lambda: {
+    (('area', area),): value for area, value in disk_usage().items()
+}, help_text='Bytes stored per area: uploads, reports, cache and scratch')
+metrics.gauge('scout_disk_quota_bytes', lambda: {
+    (('area', area),): value for area, value in disk_quotas().items()
+}, help_text='Disk quota per area (0 = unlimited)')
+metrics.gauge('scout_admission', lambda: {
+    (('field', key),): value for key, value in admission.stats().items()
+}, help_text='Heavy-work slots and queue size for the host, and requests waiting and running in this process')
+metrics.gauge('scout_scratch_workspaces', lambda: scratch_space.active,
+              help_text='Report builds holding a scratch workspace in this process')
+metrics.gauge('scout_images_normalized', lambda: image_ingest_stats['images'],
+              help_text='Receipt photos normalized by this process')
+metrics.gauge('scout_image_bytes_saved', lambda: image_ingest_stats['bytes_saved'],
+              help_text='Bytes saved by normalizing receipt photos in this process')
+# Sweep totals are kept in the manifest, so they include sweeps run by other processes and cron
+metrics.counter('scout_files_reclaimed_total', lambda: file_manifest.totals()['files_reclaimed'],
+                help_text='Expired files deleted by the expiry sweep')
+metrics.counter('scout_bytes_freed_total', lambda: file_manifest.totals()['bytes_freed'],
+                help_text='Bytes freed by the expiry sweep')
 
 @app.route('/submit', methods=['POST'])
 def submit():
     try:
-        # Collect form data
-        data = {
-            'requestor_first': request.form.get('requestor_first', ''),
-            'requestor_last': request.form.get('requestor_last', ''),
-            'email': request.form.get('email', ''),
-            'troop_number': request.form.get('troop_number', ''),
-            'event_name': request.form.get('event_name', ''),
-            'event_date': request.form.get('event_date', ''),
-            'reason': request.form.get('reason', ''),
-            'date_created': request.form.get('date_created', ''),
-            'purchases': [],
-            'mileage': []
-        }
+        # Reading the form pulls the whole upload off the wire
+        with stage('upload'):
+            form, files = request.form, request.files
         
-        # Collect signature data
-        signature_data = {
-            'name': request.form.get('signature_name', ''),
-            'date': datetime.now().strftime('%B %d, %Y at %I:%M %p'),
-            'acknowledgment': request.form.get('signature_acknowledgment', '') == 'on'
-        }
+        check_quota('reports')
         
-        # Dictionary to store purchase documents mapped to their index
-        purchase_documents = {}
+        # Resubmitting an edited report replaces the earlier submission and may keep its receipts
+        submission_id = form.get('submission_id') or None
+        previous_documents = None
+        if submission_id:
+            previous = submission_store.get(submission_id)
+            if previous is None:
+                return "Submission not found", 404
+            previous_documents = previous.get('purchase_documents') or {}
         
-        # Collect purchase data and associated files
-        i = 0
-        while True:
-            date = request.form.get(f'purchase_date_{i}', None)
-            if date is None:
-                break
-            
-            if date:  # Only add if date is provided
-                data['purchases'].append({
-                    'date': date,
-                    'place': request.form.get(f'purchase_place_{i}', ''),
-                    'items': request.form.get(f'items_summary_{i}', ''),
-                    'amount': request.form.get(f'purchase_amount_{i}', '')
-                })
-                
-                # Handle file upload for this specific purchase
-                file_key = f'purchase_doc_{i}'
-                if file_key in request.files:
-                    file = request.files[file_key]
-                    if file and file.filename and allowed_file(file.filename):
-                        filename = secure_filename(file.filename)
-                        unique_filename = f"{uuid.uuid4()}_{filename}"
-                        filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-                        file.save(filepath)
-                        # Map the file to this purchase index
-                        purchase_documents[len(data['purchases']) - 1] = filepath
-            i += 1
+        with stage('collect'):
+            data, purchase_documents, signature_data = collect_submission(form, files, previous_documents)
         
-        # Collect mileage data (dynamic number of rows)
-        i = 0
-        while True:
-            date = request.form.get(f'mileage_date_{i}', None)
-            if date is None:
-                break
-            
-            if date:  # Only add if date is provided
-                data['mileage'].append({
-                    'date': date,
-                    'start': request.form.get(f'mileage_start_{i}', ''),
-                    'destination': request.form.get(f'mileage_dest_{i}', ''),
-                    'miles': request.form.get(f'mileage_miles_{i}', '')
+        # Receipt-free reports take milliseconds, so in-memory modes build them here rather than queueing
+        if app.config['REPORT_STORAGE'] in ('memory', 'stream') and not purchase_documents:
+            output = report_buffer()
+            with stage('generate_report'):
+                report_id, report_filename = generate_expense_report(data, purchase_documents, signature_data, output, submission_id)
+            if app.config['REPORT_STORAGE'] == 'stream':
+                output.seek(0)
+                return send_file(output, mimetype='application/pdf', as_attachment=True, download_name=report_filename)
+            with output:
+                cached = report_memory.put(report_id, output, report_filename, submission_id)
+            if cached['path']:
+                # Spill files outlive the process if it restarts; let the expiry sweep catch those
+                track_file(cached['path'], 'spool')
+            return redirect(url_for('download', report_id=report_id))
+        
+        if app.config['REPORT_JOBS_ENABLED']:
+            with stage('enqueue'):
+                job_id = job_queue.enqueue({
+                    'data': data,
+                    'purchase_documents': purchase_documents,
+                    'signature_data': signature_data,
+                    'submission_id': submission_id
                 })
-            i += 1
+            report_workers.start()
+            return redirect(url_for('download', report_id=job_id))
         
         # Generate PDF
-        report_id, report_filename = generate_expense_report(data, purchase_documents, signature_data)
+        with stage('generate_report'):
+            report_id, report_filename = generate_expense_report(data, purchase_documents, signature_data, submission_id=submission_id)
         
-        return redirect(url_for('download', report_id=report_id, filename=report_filename))
+        return redirect(url_for('download', report_id=report_id))
     
+    except HTTPException:
+        # Upload limits and type checks carry their own status codes
+        raise
     except Exception as e:
         return f"Error generating report: {str(e)}", 500
 
 @app.route('/download/<report_id>')
 def download(report_id):
-    filename = request.args.get('filename', f'expense_report_{report_id}.pdf')
-    return render_template('download.html', report_id=report_id, filename=filename)
+    filename = None
+    edit_url = None
+    if job_queue.status(report_id) is None:
+        info = report_memory.get(report_id) or report_store.get(report_id)
+        if info is None:
+            return "Report not found", 404
+        filename = info['download_name']
+        edit_url = url_for('edit_submission', submission_id=info['submission_id'] or report_id)
+    return render_template('download.html', report_id=report_id, filename=filename, edit_url=edit_url)
+
+@app.route('/status/<job_id>')
+def job_status(job_id):
+    """Lightweight polling endpoint for queued report builds"""
+    info = job_queue.status(job_id)
+    if info is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if info['status'] in ('queued', 'running'):
+        # Make sure this process is draining the queue, e.g. after a restart
+        report_workers.start()
+    info['queue_depth'] = job_queue.depth()
+    if info['status'] == 'done':
+        info['download_url'] = url_for('report_file', report_id=info['result']['report_id'])
+        submission_id = info['result'].get('submission_id') or info['result']['report_id']
+        info['edit_url'] = url_for('edit_submission', submission_id=submission_id)
+    return jsonify(info)
+
+@app.route('/report/<report_id>')
+def report_file(report_id):
+    """Serve a stored report, answering If-None-Match and Range requests from its metadata"""
+    cached = report_memory.get(report_id)
+    if cached is not None:
+        response = werkzeug_send_file(
+            io.BytesIO(cached['data']) if cached['data'] is not None else cached['path'], request.environ,
+            mimetype='application/pdf',
+            as_attachment=True,
+            download_name=cached['download_name'],
+            etag=cached['sha256'],
+            max_age=app.config['REPORT_CACHE_SECONDS'],
+            conditional=True
+        )
+        response.cache_control.public = False
+        response.cache_control.private = True
+        return response
+    
+    info = report_store.get(report_id)
+    if info is None or not os.path.exists(info['path']):
+        return "Report not found", 404
+    
+    offload = app.config['REPORT_SENDFILE'] in ('x-sendfile', 'x-accel')
+    response = werkzeug_send_file(
+        info['path'], request.environ,
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=info['download_name'],
+        etag=info['sha256'],
+        max_age=app.config['REPORT_CACHE_SECONDS'],
+        use_x_sendfile=offload,
+        # The front-end server answers Range itself when it sends the file
+        conditional=not offload
+    )
+    response.cache_control.public = False
+    response.cache_control.private = True
+    
+    if offload:
+        response.make_conditional(request.environ)
+        if response.status_code == 304:
+            response.headers.pop('X-Sendfile', None)
+        elif app.config['REPORT_SENDFILE'] == 'x-accel':
+            del response.headers['X-Sendfile']
+            response.headers['X-Accel-Redirect'] = app.config['REPORT_ACCEL_PREFIX'] + os.path.basename(info['path'])
+    return response
 
 @app.route('/get_report/<filename>')
 def get_report(filename):
-    report_path = os.path.join(app.config['REPORT_FOLDER'], filename)
+    """Reports saved under their friendly name before reports were stored by id"""
+    report_path = os.path.join(app.config['REPORT_FOLDER'], secure_filename(filename))
     if os.path.exists(report_path):
-        return send_file(report_path, as_attachment=True, download_name=filename)
+        return send_file(report_path, as_attachment=True, download_name=filename, conditional=True)
     return "Report not found", 404
 
+def treasurer_required(view):
+    """Allow a view only with the treasurer token, as ?token= or a Bearer header"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = app.config['TREASURER_TOKEN']
+        if not token:
+            return "Treasurer reports are not enabled", 404
+        supplied = request.args.get('token') or request.headers.get('Authorization', '').removeprefix('Bearer ')
+        # Constant-time, so response timing gives nothing away about the token
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            return "Unauthorized", 401
+        return view(*args, **kwargs)
+    return wrapper
+
+def treasurer_filters(args):
+    """Filters shared by the treasurer endpoints and CLI"""
+    return {
+        'event': args.get('event'),
+        'requestor': args.get('requestor'),
+        'troop': args.get('troop'),
+        'date_from': args.get('from'),
+        'date_to': args.get('to'),
+    }
+
+def treasurer_response(rows, filename):
+    """JSON by default, or a CSV download with ?format=csv"""
+    if request.args.get('format') == 'csv':
+        return Response(rows_to_csv(rows), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+    return jsonify(rows)
+
+def stored_report_path(row):
+    """Path of a submission's report on disk, or None once it has expired (or was never written to disk)"""
+    info = report_store.get(row['report_id']) if row['report_id'] else None
+    if info is not None and os.path.exists(info['path']):
+        return info['path']
+    # Reports saved under their friendly name before reports were stored by id. A row with an id
+    # whose report is gone must not fall back, or it could pick up someone else's same-named file.
+    if not row['report_id'] and row['report_filename']:
+        legacy_path = os.path.join(app.config['REPORT_FOLDER'], secure_filename(row['report_filename']))
+        if os.path.isfile(legacy_path):
+            return legacy_path
+    return None
+
+def export_entries(filters):
+    """(name, source) pairs for a report export: summary.csv with every matching submission, then its PDFs"""
+    rows = submission_store.submissions(None, **filters)
+    rows.sort(key=lambda row: (row['event_date'], row['created_at']))
+    
+    reports = []
+    taken = {'summary.csv'}
+    summary = []
+    for row in rows:
+        path = stored_report_path(row)
+        name = unique_name(f"reports/{row['report_filename'] or row['id'] + '.pdf'}", taken) if path else ''
+        if path:
+            reports.append((name, path))
+        summary.append({
+            'event_name': row['event_name'],
+            'event_date': row['event_date'],
+            'requestor': row['requestor'],
+            'troop_number': row['troop_number'],
+            'email': row['email'],
+            'purchases': row['purchases'],
+            'miles': row['miles'],
+            'mileage': row['mileage'],
+            'grand': row['grand'],
+            'submission_id': row['id'],
+            'report': name or 'not stored',
+        })
+    if summary:
+        total = {key: '' for key in summary[0]}
+        total['event_name'] = 'TOTAL'
+        for measure in ('purchases', 'miles', 'mileage', 'grand'):
+            total[measure] = round(sum(row[measure] for row in summary), 2)
+        summary.append(total)
+    
+    yield 'summary.csv', rows_to_csv(summary).encode('utf-8')
+    yield from reports
+
+def export_filename(filters):
+    parts = [sanitize_filename(value) for value in filters.values() if value]
+    return '_'.join(['expense-reports'] + [part for part in parts if part]) + '.zip'
+
+def packet_cover(title, entries, cover_pages):
+    """Index pages for a treasurer packet: requestor, totals and first page of every report"""
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Table
+    from report_template import get_report_template
+    
+    template = get_report_template()
+    cell = template.signature_style
+    table_data = [['#', 'Requestor', 'Event', 'Date', 'Purchases', 'Mileage', 'Total', 'Page']]
+    page = cover_pages + 1
+    totals = {'purchases': 0, 'mileage': 0, 'grand': 0}
+    for number, (row, path, page_count) in enumerate(entries, 1):
+        table_data.append([
+            str(number), Paragraph(row['requestor'], cell), Paragraph(row['event_name'], cell), row['event_date'],
+            f"${row['purchases']:.2f}", f"${row['mileage']:.2f}", f"${row['grand']:.2f}",
+            str(page) if path else 'n/a'
+        ])
+        page += page_count
+        for measure in totals:
+            totals[measure] += row[measure]
+    table_data.append(['', 'TOTAL', '', '', f"${totals['purchases']:.2f}", f"${totals['mileage']:.2f}",
+                       f"${totals['grand']:.2f}", ''])
+    
+    story = [
+        Paragraph(title, template.title_style),
+        Paragraph(f"{len(entries)} submissions, generated {datetime.now().strftime('%B %d, %Y')}. "
+                  f"Reports marked n/a have expired and are not included.", template.header_style),
+        Table(table_data, colWidths=template.packet_col_widths, style=template.line_item_table_style, repeatRows=1),
+    ]
+    output = io.BytesIO()
+    with admission.slot('doc_build'), stage('doc_build'):
+        SimpleDocTemplate(output, **REPORT_DOC_KWARGS).build(story)
+    output.seek(0)
+    return output
+
+def packet_documents(filters):
+    """[(source, bookmark title)] for a treasurer packet: the cover index, then every stored report in order"""
+    from PyPDF2 import PdfReader
+    
+    rows = submission_store.submissions(None, **filters)
+    rows.sort(key=lambda row: (row['event_date'], row['created_at']))
+    entries = []
+    for row in rows:
+        path = stored_report_path(row)
+        page_count = 0
+        if path:
+            try:
+                page_count = len(PdfReader(path).pages)
+            except Exception as e:
+                print(f"Error reading report {path}: {e}")
+                path = None
+        entries.append((row, path, page_count))
+    
+    title = ' / '.join(value for value in filters.values() if value) or 'All events'
+    title = f"Treasurer Packet: {title}"
+    # Page numbers depend on how long the index itself is; it settles after a render or two
+    cover_pages = 1
+    for _ in range(3):
+        cover = packet_cover(title, entries, cover_pages)
+        rendered_pages = len(PdfReader(cover).pages)
+        cover.seek(0)
+        if rendered_pages == cover_pages:
+            break
+        cover_pages = rendered_pages
+    
+    documents = [(cover, 'Index')]
+    for row, path, _ in entries:
+        if path:
+            documents.append((path, f"{row['requestor']}: {row['event_name']} ({row['event_date']})"))
+    return documents
+
+def packet_chunks(documents):
+    """Stream a treasurer packet, logging its size and what deduplication saved"""
+    from packet import PacketWriter
+    
+    writer = PacketWriter()
+    start = time.perf_counter()
+    yield from writer.chunks(documents)
+    app.logger.info(
+        f"Built treasurer packet: {len(documents) - 1} reports, {len(writer.page_numbers)} pages, "
+        f"{writer.position} bytes, {writer.duplicates} shared streams, {time.perf_counter() - start:.2f}s"
+    )
+
+def packet_filename(filters):
+    return export_filename(filters).replace('expense-reports', 'treasurer-packet', 1)[:-len('.zip')] + '.pdf'
+
+@app.route('/treasurer/rollup')
+@treasurer_required
+def treasurer_rollup():
+    """Totals grouped by ?group_by=event,requestor,troop,date"""
+    try:
+        group_by = parse_group_by(request.args.get('group_by', 'event'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    rows = submission_store.rollup(group_by, **treasurer_filters(request.args))
+    return treasurer_response(rows, 'rollup.csv')
+
+@app.route('/treasurer/submissions')
+@treasurer_required
+def treasurer_submissions():
+    """Individual submissions matching the filters"""
+    limit = request.args.get('limit', 500, type=int)
+    rows = submission_store.submissions(limit, **treasurer_filters(request.args))
+    return treasurer_response(rows, 'submissions.csv')
+
+@app.route('/treasurer/export')
+@treasurer_required
+def treasurer_export():
+    """Every stored report matching the filters, plus summary.csv, streamed as one ZIP"""
+    filters = treasurer_filters(request.args)
+    return Response(stream_zip(export_entries(filters)), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename={export_filename(filters)}'})
+
+@app.route('/treasurer/packet')
+@treasurer_required
+def treasurer_packet():
+    """All stored reports matching the filters merged into one PDF behind a cover index"""
+    filters = treasurer_filters(request.args)
+    documents = packet_documents(filters)
+    return Response(packet_chunks(documents), mimetype='application/pdf',
+                    headers={'Content-Disposition': f'attachment; filename={packet_filename(filters)}'})
+
+@app.cli.command('report-worker')
+def report_worker_command():
+    """Drain the report job queue in the foreground"""
+    report_workers.run()
+
+@app.cli.command('sweep-expired')
+@click.option('--scan-folders', is_flag=True,
+              help='Also scan the upload and report folders for files written before the manifest existed')
+def sweep_expired_command(scan_folders):
+    """Delete uploads, page images and reports past their retention"""
+    reclaimed = sweep_expired_files()
+    totals = file_manifest.totals()
+    print(f"Reclaimed {reclaimed['files']} files, {reclaimed['bytes']} bytes "
+          f"({totals['files_reclaimed']} files, {totals['bytes_freed']} bytes in total)")
+    if scan_folders:
+        print(f"Folder scan removed {cleanup_old_files()} untracked files")
+
+@app.cli.command('disk-usage')
+def disk_usage_command():
+    """Show bytes stored per area against its quota"""
+    quotas = disk_quotas()
+    for area, used in disk_usage().items():
+        quota = quotas[area]
+        limit = f"{quota // (1024 * 1024)}MB ({used * 100 // quota}%)" if quota else 'unlimited'
+        print(f"{area:<8} {used / (1024 * 1024):10.1f}MB of {limit}")
+
+@app.cli.command('rollup')
+@click.option('--by', 'group_by', default='event', help='Comma-separated: event, requestor, troop, date')
+@click.option('--event', help='Only this event name')
+@click.option('--requestor', help='Only this requestor')
+@click.option('--troop', help='Only this troop number')
+@click.option('--from', 'date_from', help='Earliest event date (YYYY-MM-DD)')
+@click.option('--to', 'date_to', help='Latest event date (YYYY-MM-DD)')
+@click.option('--csv', 'csv_path', type=click.Path(dir_okay=False, writable=True), help='Write CSV here instead of printing it')
+def rollup_command(group_by, event, requestor, troop, date_from, date_to, csv_path):
+    """Print expense totals grouped by event, requestor, troop or date"""
+    try:
+        group_by = parse_group_by(group_by)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--by')
+    rows = submission_store.rollup(group_by, event=event, requestor=requestor, troop=troop,
+                                   date_from=date_from, date_to=date_to)
+    if csv_path:
+        with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+            f.write(rows_to_csv(rows))
+        print(f"Wrote {len(rows)} rows to {csv_path}")
+    else:
+        print(rows_to_csv(rows), end='')
+
+@app.cli.command('export-reports')
+@click.option('--event', help='Only this event name')
+@click.option('--requestor', help='Only this requestor')
+@click.option('--troop', help='Only this troop number')
+@click.option('--from', 'date_from', help='Earliest event date (YYYY-MM-DD)')
+@click.option('--to', 'date_to', help='Latest event date (YYYY-MM-DD)')
+@click.option('--output', type=click.Path(dir_okay=False, writable=True, allow_dash=True),
+              help='ZIP file to write, or - for stdout (default: named after the filters)')
+def export_reports_command(event, requestor, troop, date_from, date_to, output):
+    """Write the matching reports and a summary CSV to a ZIP"""
+    filters = {'event': event, 'requestor': requestor, 'troop': troop, 'date_from': date_from, 'date_to': date_to}
+    output = output or export_filename(filters)
+    with click.open_file(output, 'wb') as f:
+        for chunk in stream_zip(export_entries(filters)):
+            f.write(chunk)
+    if output != '-':
+        print(f"Wrote {output} ({os.path.getsize(output)} bytes)")
+
+@app.cli.command('treasurer-packet')
+@click.option('--event', help='Only this event name')
+@click.option('--requestor', help='Only this requestor')
+@click.option('--troop', help='Only this troop number')
+@click.option('--from', 'date_from', help='Earliest event date (YYYY-MM-DD)')
+@click.option('--to', 'date_to', help='Latest event date (YYYY-MM-DD)')
+@click.option('--output', type=click.Path(dir_okay=False, writable=True, allow_dash=True),
+              help='PDF file to write, or - for stdout (default: named after the filters)')
+def treasurer_packet_command(event, requestor, troop, date_from, date_to, output):
+    """Merge the matching reports into one PDF with a cover index"""
+    filters = {'event': event, 'requestor': requestor, 'troop': troop, 'date_from': date_from, 'date_to': date_to}
+    output = output or packet_filename(filters)
+    documents = packet_documents(filters)
+    with click.open_file(output, 'wb') as f:
+        for chunk in packet_chunks(documents):
+            f.write(chunk)
+    if output != '-':
+        print(f"Wrote {output} ({os.path.getsize(output)} bytes, {len(documents) - 1} reports)")
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute the treasurer rollups from the stored submissions"""
+    submission_store.rebuild_rollups()
+    print("Rollups rebuilt")
+
+@app.cli.command('warm-up')
+def warm_up_command():
+    """Time loading the PDF stack and rendering a first report"""
+    print(f"Warm-up took {warm_up():.3f}s")
+
+if app.config['WARM_UP']:
+    warm_up()
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+"""Generate expense reports in bulk from a JSONL or CSV file.
+
+Each row uses the same field names as the web form (requestor_first, event_name,
+purchase_date_0, purchase_amount_0, mileage_miles_0, signature_name, ...). A receipt
+is attached by giving its file path in purchase_doc_{i}. An optional `id` column
+identifies the row in the results manifest; otherwise the row number is used.
+
+    python batch.py submissions.jsonl --workers 4 --results results.jsonl
+
+Results are appended to the manifest as each report finishes, so an interrupted run
+can be restarted with the same command and skips the rows that already succeeded.
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime
+from werkzeug.datastructures import FileStorage
+
+import app
+
+
+def read_rows(path):
+    """Yield (row_id, fields) from a JSONL or CSV file"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.lower().endswith('.csv'):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for number, row in enumerate(rows, start=1):
+            # CSV leaves unused columns as empty strings; the form omits them
+            fields = {key: str(value) for key, value in row.items() if value not in (None, '')}
+            yield str(fields.pop('id', number)), fields
+
+
+def completed_rows(results_path):
+    """Row ids that already have a successful report in the manifest"""
+    done = set()
+    if os.path.exists(results_path):
+        with open(results_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash
+                    continue
+                if result.get('status') == 'ok':
+                    done.add(result['id'])
+    return done
+
+
+def build_row(task):
+    """Pool worker: generate one report and return its manifest entry"""
+    row_id, fields = task
+    start = time.perf_counter()
+    files = {}
+    try:
+        for key, value in fields.items():
+            if key.startswith('purchase_doc_'):
+                files[key] = FileStorage(stream=open(value, 'rb'), filename=os.path.basename(value), name=key)
+        form = {key: value for key, value in fields.items() if key not in files}
+
+        # Batch rows wait for a heavy-work slot like background jobs instead of getting 503
+        with app.app.app_context(), app.admission.background():
+            data, purchase_documents, signature_data = app.collect_submission(form, files)
+            if 'signature_date' in form:
+                signature_data['date'] = form['signature_date']
+            report_id, report_filename = app.generate_expense_report(data, purchase_documents, signature_data)
+        return {
+            'id': row_id,
+            'status': 'ok',
+            'report_id': report_id,
+            'report_filename': report_filename,
+            'seconds': round(time.perf_counter() - start, 3),
+        }
+    except Exception as e:
+        return {
+            'id': row_id,
+            'status': 'error',
+            'error': f"{type(e).__name__}: {e}",
+            'seconds': round(time.perf_counter() - start, 3),
+        }
+    finally:
+        for file in files.values():
+            file.close()
+
+
+def run_batch(input_path, results_path, workers, progress_every=1):
+    done = completed_rows(results_path)
+    tasks = [(row_id, fields) for row_id, fields in read_rows(input_path) if row_id not in done]
+    total = len(tasks)
+    print(f"{len(done)} rows already done, {total} to generate with {workers} workers", file=sys.stderr)
+
+    counts = {'ok': 0, 'error': 0}
+    started = time.perf_counter()
+    with open(results_path, 'a', encoding='utf-8') as results, \
+            multiprocessing.Pool(workers, maxtasksperchild=200) as pool:
+        for finished, result in enumerate(pool.imap_unordered(build_row, tasks), start=1):
+            # One line per report, flushed right away so a crash loses nothing that finished
+            result['finished_at'] = datetime.now().isoformat(timespec='seconds')
+            results.write(json.dumps(result) + '\n')
+            results.flush()
+            counts[result['status']] += 1
+
+            if finished % progress_every == 0 or finished == total:
+                elapsed = time.perf_counter() - started
+                rate = finished / elapsed if elapsed else 0
+                remaining = (total - finished) / rate if rate else 0
+                print(f"[{finished}/{total}] {counts['ok']} ok, {counts['error']} failed, "
+                      f"{rate:.1f} reports/s, ~{remaining:.0f}s left", file=sys.stderr)
+            if result['status'] == 'error':
+                print(f"Row {result['id']} failed: {result['error']}", file=sys.stderr)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate expense reports in bulk from JSONL or CSV')
+    parser.add_argument('input', help='submissions file (.jsonl or .csv)')
+    parser.add_argument('--results', help='results manifest (default: <input>.results.jsonl)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='worker processes')
+    parser.add_argument('--progress-every', type=int, default=10, help='print progress every N reports')
+    args = parser.parse_args()
+
+    results_path = args.results or f"{os.path.splitext(args.input)[0]}.results.jsonl"
+    counts = run_batch(args.input, results_path, args.workers, args.progress_every)
+    print(f"Done: {counts['ok']} reports written, {counts['error']} failed. Results in {results_path}", file=sys.stderr)
+    sys.exit(1 if counts['error'] else 0)
+
+
+if __name__ == '__main__':
+    main()
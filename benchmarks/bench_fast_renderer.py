@@ -0,0 +1,43 @@
+#!/usr/bin/python3
+"""Per-report time for receipt-free reports: fast canvas renderer versus SimpleDocTemplate.
+
+Run from the project root:
+    python benchmarks/bench_fast_renderer.py [iterations]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Imported first: it points app at a throwaway storage root before app is loaded
+from bench_report_template import SAMPLE_DATA, SAMPLE_SIGNATURE
+import app
+
+
+def seconds_per_report(iterations, fast):
+    app.app.config['FAST_RENDERER'] = fast
+    start = time.perf_counter()
+    for _ in range(iterations):
+        app.generate_expense_report(SAMPLE_DATA, {}, SAMPLE_SIGNATURE)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    # The first fast render records the layout for this report shape
+    seconds_per_report(5, True)
+    seconds_per_report(5, False)
+
+    platypus = seconds_per_report(iterations, False)
+    fast = seconds_per_report(iterations, True)
+
+    print(f"iterations:        {iterations}")
+    print(f"SimpleDocTemplate: {platypus * 1000:.2f} ms/report")
+    print(f"fast renderer:     {fast * 1000:.2f} ms/report")
+    print(f"speed-up:          {platypus / fast:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,361 @@
+#!/usr/bin/python3
+"""Stage timings and peak memory for the report pipeline on synthetic receipt corpora.
+
+Every input is generated locally from a fixed seed: photo receipts in JPEG, PNG and
+TIFF at several resolutions, multi-page PDF receipts, and forms with N purchases and
+M mileage rows. Each scenario runs in a fresh process, so its peak RSS is its own.
+Stages are timed over several repeats (median), then run once more under tracemalloc
+for their peak Python allocation.
+
+Run from the project root:
+    python benchmarks/bench_pipeline.py --output results.json
+    python benchmarks/bench_pipeline.py --baseline baseline.json --threshold 0.25
+
+With --baseline, any time or memory figure more than --threshold above the baseline
+is reported and the exit status is 1. Rasterization is skipped when poppler is not
+installed.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SEED = 233
+
+PHOTO_SIZES = {
+    'small': (1000, 1400),
+    'scan': (2550, 3300),
+    'phone': (3024, 4032),
+}
+
+# name: {purchases, mileage, photos: [(size, format)], pdfs: [page counts]}
+SCENARIOS = {
+    'summary-only': {'purchases': 4, 'mileage': 3, 'photos': [], 'pdfs': []},
+    'lines-40x20': {'purchases': 40, 'mileage': 20, 'photos': [], 'pdfs': []},
+    'photos-small-jpg': {'purchases': 5, 'mileage': 1, 'photos': [('small', 'jpg')] * 5, 'pdfs': []},
+    'photos-phone-jpg': {'purchases': 5, 'mileage': 1, 'photos': [('phone', 'jpg')] * 5, 'pdfs': []},
+    'photos-phone-png': {'purchases': 5, 'mileage': 1, 'photos': [('phone', 'png')] * 5, 'pdfs': []},
+    'photos-scan-tiff': {'purchases': 5, 'mileage': 1, 'photos': [('scan', 'tiff')] * 5, 'pdfs': []},
+    'pdf-1p': {'purchases': 3, 'mileage': 1, 'photos': [], 'pdfs': [1, 1, 1]},
+    'pdf-5p': {'purchases': 3, 'mileage': 1, 'photos': [], 'pdfs': [5, 5, 5]},
+    'pdf-20p': {'purchases': 2, 'mileage': 1, 'photos': [], 'pdfs': [20, 20]},
+    'mixed-20': {
+        'purchases': 20, 'mileage': 4,
+        'photos': [('small', 'jpg'), ('phone', 'jpg'), ('small', 'png'), ('scan', 'tiff')] * 3,
+        'pdfs': [1, 2, 3, 5] * 2,
+    },
+}
+QUICK_SCENARIOS = ('summary-only', 'photos-small-jpg', 'pdf-5p')
+
+
+def synthetic_photo(rng, size, fmt):
+    """A receipt-like photo: paper on a darker background with rows of 'text'"""
+    from PIL import Image, ImageDraw
+    width, height = size
+    image = Image.new('RGB', size, (rng.randint(60, 90), rng.randint(60, 90), rng.randint(60, 90)))
+    draw = ImageDraw.Draw(image)
+    margin = width // 8
+    draw.rectangle([margin, height // 20, width - margin, height - height // 20], fill=(245, 243, 236))
+    line_height = max(8, height // 80)
+    for y in range(height // 10, height - height // 10, line_height * 2):
+        x = margin + line_height
+        while x < width - margin - line_height * 2:
+            word = rng.randint(line_height, line_height * 6)
+            shade = rng.randint(20, 70)
+            draw.rectangle([x, y, min(x + word, width - margin - line_height), y + line_height], fill=(shade, shade, shade))
+            x += word + line_height
+    output = io.BytesIO()
+    if fmt == 'jpg':
+        image.save(output, 'JPEG', quality=92)
+    elif fmt == 'png':
+        image.save(output, 'PNG')
+    else:
+        image.save(output, 'TIFF', compression='tiff_lzw')
+    return output.getvalue()
+
+
+def synthetic_pdf(rng, pages):
+    """A multi-page receipt PDF with text lines and a logo box on each page"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen.canvas import Canvas
+    output = io.BytesIO()
+    canv = Canvas(output, pagesize=letter, invariant=1)
+    for page in range(pages):
+        canv.setFillGray(0.85)
+        canv.rect(72, 680, 120, 60, fill=1, stroke=0)
+        canv.setFillGray(0)
+        canv.setFont('Helvetica-Bold', 16)
+        canv.drawString(210, 700, f"STORE #{rng.randint(100, 999)} - page {page + 1} of {pages}")
+        canv.setFont('Courier', 10)
+        for line in range(45):
+            canv.drawString(72, 650 - line * 12, f"ITEM {rng.randint(10000, 99999)}   QTY {rng.randint(1, 9)}   ${rng.uniform(1, 99):8.2f}")
+        canv.showPage()
+    canv.save()
+    return output.getvalue()
+
+
+def synthetic_form(rng, purchases, mileage):
+    data = {
+        'requestor_first': 'Pat',
+        'requestor_last': 'Scout',
+        'email': 'pat@example.com',
+        'troop_number': '233',
+        'event_name': 'Benchmark Camp',
+        'event_date': '2026-07-12',
+        'reason': 'Synthetic benchmark submission',
+        'date_created': '2026-07-20',
+        'purchases': [
+            {'date': '2026-07-10', 'place': f"Store {i}", 'items': f"Supplies batch {i}", 'amount': f"{rng.uniform(5, 150):.2f}"}
+            for i in range(purchases)
+        ],
+        'mileage': [
+            {'date': '2026-07-12', 'start': 'Church', 'destination': f"Site {i}", 'miles': f"{rng.uniform(5, 90):.1f}"}
+            for i in range(mileage)
+        ],
+    }
+    signature = {'name': 'Pat Scout', 'date': 'July 20, 2026 at 09:00 AM'}
+    return data, signature
+
+
+def build_corpus(spec):
+    """Deterministic receipts and form data for one scenario; receipts are (filename, bytes)"""
+    rng = random.Random(SEED)
+    receipts = [(f"photo{i}.{fmt}", synthetic_photo(rng, PHOTO_SIZES[size], fmt)) for i, (size, fmt) in enumerate(spec['photos'])]
+    receipts += [(f"receipt{i}.pdf", synthetic_pdf(rng, pages)) for i, pages in enumerate(spec['pdfs'])]
+    data, signature = synthetic_form(rng, max(spec['purchases'], len(receipts)), spec['mileage'])
+    return data, signature, receipts
+
+
+def poppler_available():
+    from pdf2image import pdfinfo_from_path
+    from pdf2image.exceptions import PDFInfoNotInstalledError
+    try:
+        pdfinfo_from_path(os.devnull)
+    except PDFInfoNotInstalledError:
+        return False
+    except Exception:
+        # Installed, and rightly refusing an empty file
+        pass
+    return True
+
+
+class Workspace:
+    """Empties the upload, report and cache folders so no repeat benefits from an earlier one"""
+
+    def __init__(self, app_module, root):
+        self.app = app_module
+        self.root = root
+        self.count = 0
+
+    def reset(self):
+        """Clear what earlier repeats left behind; returns a new empty directory for this repeat"""
+        config = self.app.app.config
+        for folder in (config['UPLOAD_FOLDER'], config['REPORT_FOLDER'],
+                       self.app.raster_cache.root, self.app.fragment_cache.root):
+            for entry in os.scandir(folder):
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.remove(entry.path)
+        self.count += 1
+        base = os.path.join(self.root, 'runs', str(self.count))
+        os.makedirs(base)
+        return base
+
+
+def measure(repeats, setup):
+    """Median seconds over repeats, then peak traced allocation of one more run"""
+    timings = []
+    for _ in range(repeats):
+        run = setup()
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+
+    run = setup()
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'seconds': round(statistics.median(timings), 6),
+        'min_seconds': round(min(timings), 6),
+        'tracemalloc_peak_bytes': peak,
+    }
+
+
+def run_scenario(name, repeats):
+    """Runs in its own process; returns {stage: figures} plus the scenario's peak RSS"""
+    # Databases, caches and admission slots all live under a throwaway storage root, never the real one
+    storage = tempfile.TemporaryDirectory()
+    os.environ['SCOUT_STORAGE_ROOT'] = storage.name
+    for variable in ('SCOUT_SCRATCH_DIR', 'SCOUT_ADMISSION_DIR'):
+        os.environ.pop(variable, None)
+    import app
+    from werkzeug.datastructures import FileStorage
+    from PIL import Image as PILImage
+
+    app.app.config['REPORT_JOBS_ENABLED'] = False
+    data, signature, receipts = build_corpus(SCENARIOS[name])
+    results = {'stages': {}, 'skipped': {}}
+
+    with storage, app.app.app_context():
+        workspace = Workspace(app, storage.name)
+
+        def ingest_all():
+            return {
+                index: app.save_upload(FileStorage(stream=io.BytesIO(content), filename=filename))
+                for index, (filename, content) in enumerate(receipts)
+            }
+
+        def ingest_setup():
+            workspace.reset()
+            return ingest_all
+
+        if receipts:
+            results['stages']['ingest'] = measure(repeats, ingest_setup)
+
+        def probe_setup():
+            workspace.reset()
+            paths = [path for path in ingest_all().values() if not path.endswith('.pdf')]
+
+            def probe():
+                # What the report does for every image: open it for its size and fit it to the box
+                for path in paths:
+                    with PILImage.open(path) as img:
+                        img_width, img_height = img.size
+                    aspect = img_height / float(img_width)
+                    img_width = min(img_width, 6.5 * 72)
+                    img_height = min(img_width * aspect, 7 * 72)
+            return probe
+
+        if SCENARIOS[name]['photos']:
+            results['stages']['probe_scale'] = measure(repeats, probe_setup)
+
+        if SCENARIOS[name]['pdfs']:
+            if poppler_available():
+                def rasterize_setup():
+                    base = workspace.reset()
+                    pdfs = [path for path in ingest_all().values() if path.endswith('.pdf')]
+                    output_folder = os.path.join(base, 'pages')
+                    os.makedirs(output_folder)
+                    dpi = app.app.config['PDF_RASTER_DPI']
+                    return lambda: [app.convert_pdf_to_images(pdf, output_folder, 1, dpi) for pdf in pdfs]
+                results['stages']['convert_pdf_to_images'] = measure(repeats, rasterize_setup)
+            else:
+                results['skipped']['convert_pdf_to_images'] = 'poppler not installed'
+
+        def report_setup(mode):
+            def setup():
+                workspace.reset()
+                app.app.config['RECEIPT_PDF_MODE'] = mode
+                documents = ingest_all()
+                return lambda: app.generate_expense_report(data, documents, signature)
+            return setup
+
+        results['stages']['generate_expense_report'] = measure(repeats, report_setup('merge'))
+        if SCENARIOS[name]['pdfs']:
+            if poppler_available():
+                results['stages']['generate_expense_report_rasterize'] = measure(repeats, report_setup('rasterize'))
+            else:
+                results['skipped']['generate_expense_report_rasterize'] = 'poppler not installed'
+
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results['peak_rss_bytes'] = maxrss if sys.platform == 'darwin' else maxrss * 1024
+    results['receipts'] = len(receipts)
+    results['receipt_bytes'] = sum(len(content) for _, content in receipts)
+    return results
+
+
+def compare(current, baseline, threshold, min_seconds):
+    """Human-readable regressions: figures more than threshold above the baseline"""
+    regressions = []
+    for name, result in current['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None:
+            continue
+        checks = [('peak_rss_bytes', result['peak_rss_bytes'], base.get('peak_rss_bytes'))]
+        for stage, figures in result['stages'].items():
+            base_figures = base.get('stages', {}).get(stage)
+            if base_figures is None:
+                continue
+            if max(figures['seconds'], base_figures['seconds']) >= min_seconds:
+                checks.append((f"{stage}.seconds", figures['seconds'], base_figures['seconds']))
+            checks.append((f"{stage}.tracemalloc_peak_bytes", figures['tracemalloc_peak_bytes'], base_figures['tracemalloc_peak_bytes']))
+        for metric, value, base_value in checks:
+            if base_value and value > base_value * (1 + threshold):
+                regressions.append(f"{name} {metric}: {base_value} -> {value} (+{(value / base_value - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the report pipeline on synthetic receipts')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='run only these (repeatable)')
+    parser.add_argument('--quick', action='store_true', help=f"run only {', '.join(QUICK_SCENARIOS)}")
+    parser.add_argument('--repeats', type=int, default=5, help='timed runs per stage (median is reported)')
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--baseline', help='compare with an earlier results file')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed growth over the baseline (0.25 = 25%%)')
+    parser.add_argument('--min-seconds', type=float, default=0.005, help='ignore timing changes of stages faster than this')
+    args = parser.parse_args()
+
+    names = args.scenario or (QUICK_SCENARIOS if args.quick else list(SCENARIOS))
+    results = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'repeats': args.repeats,
+            'seed': SEED,
+        },
+        'scenarios': {},
+    }
+
+    # A new process per scenario keeps peak RSS and warm caches from leaking between them
+    context = multiprocessing.get_context('spawn')
+    for name in names:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = pool.submit(run_scenario, name, args.repeats).result()
+        results['scenarios'][name] = result
+        stages = ', '.join(f"{stage} {figures['seconds'] * 1000:.1f}ms/{figures['tracemalloc_peak_bytes'] / 1e6:.1f}MB"
+                           for stage, figures in result['stages'].items())
+        print(f"{name:20} rss {result['peak_rss_bytes'] / 1e6:6.1f}MB  {stages}")
+        for stage, reason in result['skipped'].items():
+            print(f"{'':20} skipped {stage}: {reason}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_seconds)
+        if regressions:
+            print(f"{len(regressions)} regressions over {args.threshold * 100:.0f}%:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions over {args.threshold * 100:.0f}% against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
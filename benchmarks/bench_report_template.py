@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+"""Per-report CPU time with the compiled report template versus rebuilding it for every report.
+
+The template and summary story are timed on their own, then as part of a whole report,
+whose layout and file and database writes dilute the difference.
+
+Run from the project root:
+    python benchmarks/bench_report_template.py [iterations]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Reports, submissions and the file manifest go to a throwaway storage root, not the real one
+STORAGE = tempfile.TemporaryDirectory()
+os.environ['SCOUT_STORAGE_ROOT'] = STORAGE.name
+
+import app
+from report_template import get_report_template
+
+SAMPLE_DATA = {
+    'requestor_first': 'Pat',
+    'requestor_last': 'Scout',
+    'email': 'pat@example.com',
+    'troop_number': '233',
+    'event_name': 'Summer Camp',
+    'event_date': '2026-07-12',
+    'reason': 'Food and fuel for the patrol cook-out',
+    'date_created': '2026-07-20',
+    'purchases': [
+        {'date': '2026-07-10', 'place': 'Grocery', 'items': 'Patrol food', 'amount': '84.17'},
+        {'date': '2026-07-11', 'place': 'Hardware', 'items': 'Propane', 'amount': '21.99'},
+    ],
+    'mileage': [
+        {'date': '2026-07-12', 'start': 'Church', 'destination': 'Camp', 'miles': '63.4'},
+    ],
+}
+SAMPLE_SIGNATURE = {'name': 'Pat Scout', 'date': 'July 20, 2026 at 09:00 AM'}
+
+
+def cpu_per_story(iterations, rebuild_template):
+    """CPU to get the template and build the summary story, the part the compiled template changes"""
+    from reportlab.platypus import Paragraph
+    total = 0.0
+    for _ in range(iterations):
+        if rebuild_template:
+            get_report_template.cache_clear()
+        start = time.process_time()
+        template = get_report_template()
+        values, _ = app.report_values(SAMPLE_DATA, SAMPLE_SIGNATURE)
+        app.build_summary_story(values, Paragraph(SAMPLE_DATA['reason'], template.header_style))
+        total += time.process_time() - start
+    return total / iterations
+
+
+def cpu_per_report(iterations, rebuild_template):
+    """CPU for a whole report, layout, file and database writes included"""
+    total = 0.0
+    for _ in range(iterations):
+        if rebuild_template:
+            # Same work the report used to do inline on every request
+            get_report_template.cache_clear()
+        start = time.process_time()
+        app.generate_expense_report(SAMPLE_DATA, {}, SAMPLE_SIGNATURE)
+        total += time.process_time() - start
+    return total / iterations
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    # The template is what SimpleDocTemplate builds from; the fast renderer would skip most of it
+    app.app.config['FAST_RENDERER'] = False
+    # Warm imports and font metrics so neither side pays one-off costs
+    cpu_per_report(5, False)
+
+    story_before = cpu_per_story(iterations, True)
+    story_after = cpu_per_story(iterations, False)
+    before = cpu_per_report(iterations, True)
+    after = cpu_per_report(iterations, False)
+
+    print(f"iterations:                {iterations}")
+    for label, rebuilt, compiled in (('template + story', story_before, story_after), ('whole report', before, after)):
+        print(f"{label}:")
+        print(f"  rebuilt per report:        {rebuilt * 1000:.2f} ms CPU/report")
+        print(f"  compiled once per process: {compiled * 1000:.2f} ms CPU/report")
+        print(f"  saved:                     {(rebuilt - compiled) * 1000:.2f} ms ({(1 - compiled / rebuilt) * 100:.1f}%)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+"""Process start-up cost: import time and first-request latency with lazy loading and with warm-up.
+
+Each sample is a fresh interpreter, as after a mod_wsgi/gunicorn process spawn:
+    eager  - PDF/imaging modules imported before the app (how app.py used to load)
+    lazy   - app imported alone; the first report pays for the PDF stack
+    warm   - SCOUT_WARM_UP=1, so the import also loads the stack and renders a dummy report
+
+Run from the project root:
+    python benchmarks/bench_startup.py [samples]
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = ('eager', 'lazy', 'warm')
+
+SUBMISSION = {
+    'requestor_first': 'Pat', 'requestor_last': 'Scout', 'email': 'pat@example.com', 'troop_number': '233',
+    'event_name': 'Summer Camp', 'event_date': '2026-07-12', 'reason': 'Patrol food', 'date_created': '2026-07-20',
+    'purchase_date_0': '2026-07-10', 'purchase_place_0': 'Grocery', 'items_summary_0': 'Food', 'purchase_amount_0': '84.17',
+    'mileage_date_0': '2026-07-12', 'mileage_start_0': 'Church', 'mileage_dest_0': 'Camp', 'mileage_miles_0': '63.4',
+    'signature_name': 'Pat Scout',
+}
+
+
+def child(mode):
+    """One sample, in a fresh process; prints its timings as JSON"""
+    start = time.perf_counter()
+    if mode == 'eager':
+        import reportlab.platypus
+        import PIL.Image
+        import PyPDF2
+        import pdf2image
+    import app
+    imported = time.perf_counter()
+
+    app.app.config['REPORT_JOBS_ENABLED'] = False
+    client = app.app.test_client()
+
+    form_start = time.perf_counter()
+    client.get('/')
+    form_seconds = time.perf_counter() - form_start
+
+    report_start = time.perf_counter()
+    response = client.post('/submit', data=SUBMISSION)
+    report_seconds = time.perf_counter() - report_start
+    assert response.status_code == 302, response.status_code
+
+    print(json.dumps({
+        'import': imported - start,
+        'first_form': form_seconds,
+        'first_report': report_seconds,
+    }))
+
+
+def sample(mode):
+    # Every sample starts from an empty storage root, so none pays for (or leaves behind) real databases
+    with tempfile.TemporaryDirectory() as storage:
+        env = dict(os.environ, SCOUT_WARM_UP='1' if mode == 'warm' else '0', SCOUT_STORAGE_ROOT=storage,
+                   SCOUT_EXPIRY_SWEEP_INTERVAL='0', SCOUT_REQUEST_LOG='0')
+        for variable in ('SCOUT_SCRATCH_DIR', 'SCOUT_ADMISSION_DIR'):
+            env.pop(variable, None)
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', mode],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == '--child':
+        child(sys.argv[2])
+        return
+
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"samples: {samples} (median)")
+    print(f"{'mode':8} {'import':>10} {'first /':>10} {'first report':>14} {'import to report':>18}")
+    for mode in MODES:
+        runs = [sample(mode) for _ in range(samples)]
+        figures = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+        total = statistics.median(run['import'] + run['first_form'] + run['first_report'] for run in runs)
+        print(f"{mode:8} {figures['import'] * 1000:8.1f}ms {figures['first_form'] * 1000:8.1f}ms "
+              f"{figures['first_report'] * 1000:12.1f}ms {total * 1000:16.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,375 @@
+#!/usr/bin/python3
+"""Load test for /submit against a local WSGI server: throughput, latency percentiles, errors and server RSS.
+
+The app is started under gunicorn for each WORKERSxTHREADS configuration (or under
+Werkzeug's threaded server when gunicorn is not installed), with its uploads, reports
+and databases in a temporary SCOUT_STORAGE_ROOT. Client threads then post multipart
+submissions with the form's own field names and synthetic receipts from a
+bench_pipeline scenario, at each concurrency level in turn. Every request carries
+receipt bytes no earlier request sent, so upload de-duplication and the receipt
+caches do not flatter the figures (--repeat-receipts turns that off).
+
+By default reports are built inside /submit (SCOUT_REPORT_JOBS=0), so latency is the
+full build; --jobs measures the queueing front end instead. The client runs on the
+same machine, so leave it some CPU when reading the results.
+
+Run from the project root:
+    python benchmarks/loadtest.py
+    python benchmarks/loadtest.py --configs 1x1,2x1,4x1,2x4 --concurrency 1,4,16,32 --duration 30
+    python benchmarks/loadtest.py --scenario pdf-5p --output load.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_pipeline import SCENARIOS, build_corpus
+
+CONTENT_TYPES = {
+    'jpg': 'image/jpeg',
+    'png': 'image/png',
+    'tiff': 'image/tiff',
+    'pdf': 'application/pdf',
+}
+
+
+def form_fields(data, signature):
+    """The expense form's fields for a submission, as (name, value) pairs"""
+    fields = [(name, data[name]) for name in (
+        'requestor_first', 'requestor_last', 'email', 'troop_number',
+        'event_name', 'event_date', 'reason', 'date_created'
+    )]
+    for i, purchase in enumerate(data['purchases']):
+        fields += [
+            (f'purchase_date_{i}', purchase['date']),
+            (f'purchase_place_{i}', purchase['place']),
+            (f'items_summary_{i}', purchase['items']),
+            (f'purchase_amount_{i}', purchase['amount']),
+        ]
+    for i, mileage in enumerate(data['mileage']):
+        fields += [
+            (f'mileage_date_{i}', mileage['date']),
+            (f'mileage_start_{i}', mileage['start']),
+            (f'mileage_dest_{i}', mileage['destination']),
+            (f'mileage_miles_{i}', mileage['miles']),
+        ]
+    fields += [('signature_name', signature['name']), ('signature_acknowledgment', 'on')]
+    return fields
+
+
+class Payloads:
+    """Multipart bodies for one scenario; receipts get a unique trailer per request unless repeat is set"""
+
+    def __init__(self, scenario, repeat):
+        data, signature, receipts = build_corpus(SCENARIOS[scenario])
+        self.repeat = repeat
+        self.boundary = f"loadtest{uuid.uuid4().hex}"
+        self.receipts = receipts
+        head = b''
+        for name, value in form_fields(data, signature):
+            head += (
+                f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            ).encode()
+        self.head = head
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+
+    def body(self):
+        parts = [self.head]
+        nonce = uuid.uuid4().hex.encode()
+        for i, (filename, content) in enumerate(self.receipts):
+            extension = filename.rsplit('.', 1)[1]
+            parts.append((
+                f'--{self.boundary}\r\nContent-Disposition: form-data; name="purchase_doc_{i}"; '
+                f'filename="{filename}"\r\nContent-Type: {CONTENT_TYPES[extension]}\r\n\r\n'
+            ).encode())
+            parts.append(content)
+            if not self.repeat:
+                # Bytes after the end of an image or PDF are ignored by every reader, but change its hash
+                parts.append(b'\n%' + nonce + b'\n')
+            parts.append(b'\r\n')
+        parts.append(f'--{self.boundary}--\r\n'.encode())
+        return b''.join(parts)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def gunicorn_available():
+    try:
+        import gunicorn
+    except ImportError:
+        return False
+    return True
+
+
+def start_server(kind, workers, threads, port, storage, jobs):
+    env = dict(
+        os.environ,
+        SCOUT_STORAGE_ROOT=storage,
+        SCOUT_REPORT_JOBS='1' if jobs else '0',
+        SCOUT_REQUEST_LOG='0',
+        SCOUT_EXPIRY_SWEEP_INTERVAL='0',
+    )
+    if kind == 'gunicorn':
+        command = [
+            sys.executable, '-m', 'gunicorn',
+            '--workers', str(workers), '--threads', str(threads),
+            '--bind', f'127.0.0.1:{port}', '--timeout', '300',
+            '--log-level', 'warning', '--chdir', ROOT, 'app:app',
+        ]
+    else:
+        command = [sys.executable, os.path.abspath(__file__), '--serve', str(port)]
+    process = subprocess.Popen(command, cwd=ROOT, env=env, start_new_session=True)
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return process
+        except OSError:
+            time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError("Server did not come up within 60s")
+
+
+def stop_server(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+def serve(port):
+    """Werkzeug's threaded server, for machines without gunicorn"""
+    import logging
+    from werkzeug.serving import make_server
+    import app
+    # One access-log line per request would swamp the results table
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    make_server('127.0.0.1', port, app.app, threaded=True).serve_forever()
+
+
+def tree_rss(pid):
+    """Resident memory in bytes of a process and all its descendants (Linux /proc), or None"""
+    if not os.path.isdir('/proc'):
+        return None
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name may contain spaces, so read the fields after its closing parenthesis
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            children.setdefault(ppid, []).append(int(entry))
+        except (OSError, ValueError, IndexError):
+            continue
+
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            pass
+        pending.extend(children.get(current, []))
+    return total
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            rss = tree_rss(self.pid)
+            if rss is not None:
+                self.samples.append(rss)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        rss = tree_rss(self.pid)
+        if rss is not None:
+            self.samples.append(rss)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_level(port, payloads, concurrency, duration, warmup, timeout):
+    """Drive the server with `concurrency` clients for warmup + duration seconds"""
+    results = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+    measure_from = start + warmup
+    deadline = measure_from + duration
+
+    def client():
+        while time.perf_counter() < deadline:
+            body = payloads.body()
+            sent = time.perf_counter()
+            status = None
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+                conn.request('POST', '/submit', body=body, headers={
+                    'Content-Type': payloads.content_type,
+                    'Content-Length': str(len(body)),
+                })
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+                conn.close()
+            except OSError as e:
+                status = type(e).__name__
+            finished = time.perf_counter()
+            if sent >= measure_from:
+                with lock:
+                    results.append((finished - sent, status, finished))
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Throughput counts requests sent in the window, over the time until the last of them finished
+    window = max(max((finished for _, _, finished in results), default=deadline), deadline) - measure_from
+    latencies = sorted(latency for latency, _, _ in results)
+    errors = [status for _, status, _ in results if not isinstance(status, int) or status >= 400]
+    return {
+        'requests': len(results),
+        'throughput': round(len(results) / window, 3) if window > 0 else 0,
+        'p50': percentile(latencies, 0.50),
+        'p90': percentile(latencies, 0.90),
+        'p99': percentile(latencies, 0.99),
+        'max': latencies[-1] if latencies else None,
+        'error_rate': round(len(errors) / len(results), 4) if results else 0,
+        'errors': sorted({str(status) for status in errors}),
+    }
+
+
+def parse_configs(text):
+    configs = []
+    for item in text.split(','):
+        workers, _, threads = item.strip().partition('x')
+        configs.append((int(workers), int(threads or 1)))
+    return configs
+
+
+def milliseconds(seconds):
+    return f"{seconds * 1000:8.1f}" if seconds is not None else f"{'-':>8}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--server', choices=('auto', 'gunicorn', 'werkzeug'), default='auto')
+    parser.add_argument('--configs', default='1x1,2x1,4x1,2x4', help='gunicorn WORKERSxTHREADS, comma separated')
+    parser.add_argument('--concurrency', default='1,4,16', help='client concurrency levels, comma separated')
+    parser.add_argument('--duration', type=float, default=15, help='measured seconds per level')
+    parser.add_argument('--warmup', type=float, default=3, help='seconds per level before measuring')
+    parser.add_argument('--timeout', type=float, default=120, help='seconds before a request counts as failed')
+    parser.add_argument('--scenario', default='photos-small-jpg', choices=sorted(SCENARIOS))
+    parser.add_argument('--repeat-receipts', action='store_true', help='send identical receipts every time')
+    parser.add_argument('--jobs', action='store_true', help='build reports on background workers (SCOUT_REPORT_JOBS=1)')
+    parser.add_argument('--output', help='write the results as JSON')
+    args = parser.parse_args()
+
+    if args.server == 'auto':
+        args.server = 'gunicorn' if gunicorn_available() else 'werkzeug'
+    configs = parse_configs(args.configs) if args.server == 'gunicorn' else [(1, 0)]
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    payloads = Payloads(args.scenario, args.repeat_receipts)
+    print(f"server: {args.server}  scenario: {args.scenario} ({len(payloads.receipts)} receipts, "
+          f"{len(payloads.body()) / 1024:.0f}KB per request)  cpus: {os.cpu_count()}  "
+          f"reports built {'by background jobs' if args.jobs else 'inside /submit'}")
+    if args.server == 'werkzeug':
+        print("gunicorn is not installed; using Werkzeug's threaded server (one process, a thread per request)")
+    print(f"{'config':8} {'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+          f"{'errors':>7} {'rss peak':>9}")
+
+    results = []
+    for workers, threads in configs:
+        label = f"{workers}x{threads}" if args.server == 'gunicorn' else 'werkzeug'
+        storage = tempfile.mkdtemp(prefix='scout-loadtest-')
+        port = free_port()
+        server = start_server(args.server, workers, threads, port, storage, args.jobs)
+        try:
+            for level in levels:
+                sampler = RssSampler(server.pid)
+                sampler.start()
+                figures = run_level(port, payloads, level, args.duration, args.warmup, args.timeout)
+                sampler.stop()
+                figures.update({
+                    'config': label,
+                    'concurrency': level,
+                    'rss_peak': max(sampler.samples) if sampler.samples else None,
+                    'rss_end': sampler.samples[-1] if sampler.samples else None,
+                })
+                results.append(figures)
+                rss = f"{figures['rss_peak'] / (1024 * 1024):7.0f}MB" if figures['rss_peak'] else f"{'-':>9}"
+                print(f"{label:8} {level:7d} {figures['throughput']:8.2f} {milliseconds(figures['p50'])} "
+                      f"{milliseconds(figures['p90'])} {milliseconds(figures['p99'])} {milliseconds(figures['max'])} "
+                      f"{figures['error_rate'] * 100:6.1f}% {rss}"
+                      + (f"  ({', '.join(figures['errors'])})" if figures['errors'] else ''))
+        finally:
+            stop_server(server)
+            shutil.rmtree(storage, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'date': datetime.now().isoformat(timespec='seconds'),
+                'server': args.server,
+                'scenario': args.scenario,
+                'jobs': args.jobs,
+                'repeat_receipts': args.repeat_receipts,
+                'duration': args.duration,
+                'cpus': os.cpu_count(),
+                'results': results,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--serve':
+        serve(int(sys.argv[2]))
+    else:
+        main()
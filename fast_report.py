@@ -0,0 +1,191 @@
+#!/usr/bin/python3
+
+import io
+import threading
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import SimpleDocTemplate, Flowable
+
+# Placeholder cell text starts with a private-use character; it is recorded, never drawn
+SLOT_PREFIX = '\ue000slot'
+
+
+class ReasonSlot(Flowable):
+    """Stand-in for the one-line reason paragraph while the layout is recorded"""
+
+    def __init__(self, height):
+        Flowable.__init__(self)
+        self.height = height
+        self.avail_width = None
+        self.position = None
+
+    def wrap(self, availWidth, availHeight):
+        self.avail_width = availWidth
+        return availWidth, self.height
+
+    def draw(self):
+        a, b, c, d, e, f = self.canv._currentMatrix
+        self.position = (self.canv.getPageNumber() - 1, e, f)
+
+
+class LayoutRecorder(Canvas):
+    """Canvas that keeps each page's drawing operations and where placeholder cells would be drawn"""
+
+    def __init__(self, *args, **kwargs):
+        Canvas.__init__(self, *args, **kwargs)
+        self.page_ops = []
+        self.slots = {}
+
+    def _record_slot(self, method, x, y, text):
+        a, b, c, d, e, f = self._currentMatrix
+        self.slots[text] = {
+            'page': self.getPageNumber() - 1,
+            'method': method,
+            'x': a * x + c * y + e,
+            'y': b * x + d * y + f,
+            'font': self._fontname,
+            'size': self._fontsize,
+            'color': self._fillColorObj,
+        }
+
+    def drawString(self, x, y, text, *args, **kwargs):
+        if text.startswith(SLOT_PREFIX):
+            return self._record_slot('drawString', x, y, text)
+        return Canvas.drawString(self, x, y, text, *args, **kwargs)
+
+    def drawRightString(self, x, y, text, *args, **kwargs):
+        if text.startswith(SLOT_PREFIX):
+            return self._record_slot('drawRightString', x, y, text)
+        return Canvas.drawRightString(self, x, y, text, *args, **kwargs)
+
+    def drawCentredString(self, x, y, text, *args, **kwargs):
+        if text.startswith(SLOT_PREFIX):
+            return self._record_slot('drawCentredString', x, y, text)
+        return Canvas.drawCentredString(self, x, y, text, *args, **kwargs)
+
+    def showPage(self):
+        self.page_ops.append(list(self._code))
+        Canvas.showPage(self)
+
+
+def placeholder_values(values):
+    """Replace every display string with a unique slot name; returns (placeholders, {slot: path})"""
+    paths = {}
+
+    def replace(value, path):
+        if isinstance(value, list):
+            return [replace(item, path + (i,)) for i, item in enumerate(value)]
+        slot = f"{SLOT_PREFIX}{len(paths)}"
+        paths[slot] = path
+        return slot
+
+    placeholders = {key: replace(value, (key,)) for key, value in values.items()}
+    return placeholders, paths
+
+
+def lookup(values, path):
+    value = values[path[0]]
+    for index in path[1:]:
+        value = value[index]
+    return value
+
+
+class FastReportRenderer:
+    """Draws the summary pages from a recorded static layout instead of re-flowing them with platypus.
+
+    The layout for each shape of report (number of purchase and mileage rows, signed or
+    not) is recorded once per process by building the normal platypus story with
+    placeholder text. Each page's static drawing - headings, warnings, table grids,
+    labels, the Scout Law block - is kept as raw PDF operations and replayed into a form
+    XObject; only the variable values are then drawn with the canvas at the positions
+    platypus used. Anything that would re-flow differently (multi-line cells, a
+    wrapping reason) is refused so the caller falls back to SimpleDocTemplate.
+    """
+
+    def __init__(self, build_story, doc_kwargs):
+        self.build_story = build_story
+        self.doc_kwargs = doc_kwargs
+        self._layouts = {}
+        self._lock = threading.Lock()
+
+    def _record_layout(self, values, reason_height):
+        placeholders, paths = placeholder_values(values)
+        reason_slot = ReasonSlot(reason_height)
+        recorders = []
+
+        def make_recorder(*args, **kwargs):
+            recorder = LayoutRecorder(*args, **kwargs)
+            recorders.append(recorder)
+            return recorder
+
+        doc = SimpleDocTemplate(io.BytesIO(), **self.doc_kwargs)
+        doc.build(self.build_story(placeholders, reason_slot), canvasmaker=make_recorder)
+        recorder = recorders[-1]
+
+        if set(recorder.slots) != set(paths) or reason_slot.position is None:
+            # Some placeholder was split, hidden or drawn twice; this shape has no fast path
+            return None
+        return {
+            'page_ops': recorder.page_ops,
+            'fonts': sorted(recorder._doc.fontMapping.items(), key=lambda item: int(item[1][2:])),
+            'slots': [(paths[slot], info) for slot, info in recorder.slots.items()],
+            'reason': (reason_slot.position, reason_slot.avail_width, reason_slot.height),
+        }
+
+    def layout_for(self, values, reason_height):
+        shape = (len(values['purchase_rows']), len(values['mileage_rows']), 'signature_name' in values, reason_height)
+        with self._lock:
+            if shape not in self._layouts:
+                self._layouts[shape] = self._record_layout(values, reason_height)
+            return self._layouts[shape]
+
+    def render(self, output, values, reason_paragraph):
+        """Write the summary pages to output; returns False if the report needs the platypus path"""
+        if any('\n' in value for value in flatten(values)):
+            return False
+        layout = self.layout_for(values, reason_paragraph.style.leading)
+        if layout is None:
+            return False
+
+        (reason_page, reason_x, reason_top), reason_width, reason_height = layout['reason']
+        _, height = reason_paragraph.wrap(reason_width, reason_height)
+        if height > reason_height:
+            return False
+
+        canv = SimpleDocTemplate(output, **self.doc_kwargs)._makeCanvas()
+        # Replayed operations name fonts /F1, /F2, ...; register them in the recorded order
+        for font_name, internal_name in layout['fonts']:
+            if canv._doc.getInternalFontName(font_name) != internal_name:
+                return False
+
+        for page, ops in enumerate(layout['page_ops']):
+            form_name = f"StaticPage{page}"
+            canv.beginForm(form_name)
+            canv._code.extend(ops)
+            canv.endForm()
+            canv.doForm(form_name)
+
+            for path, slot in layout['slots']:
+                if slot['page'] != page:
+                    continue
+                canv.setFont(slot['font'], slot['size'])
+                canv.setFillColor(slot['color'])
+                getattr(canv, slot['method'])(slot['x'], slot['y'], lookup(values, path))
+
+            if page == reason_page:
+                # Table cells align flowables to the top of the cell
+                reason_paragraph.drawOn(canv, reason_x, reason_top + reason_height - height)
+            canv.showPage()
+
+        canv.save()
+        return True
+
+
+def flatten(value):
+    if isinstance(value, dict):
+        for item in value.values():
+            yield from flatten(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from flatten(item)
+    else:
+        yield value
@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+
+import hashlib
+import json
+import os
+import threading
+import uuid
+from rastercache import file_sha256
+from scratch import move_into
+
+
+class FragmentCache:
+    """Supporting-document pages rendered for one receipt, stored as PDFs by content hash and layout"""
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, receipt_path, **layout):
+        """Cache key for a receipt file rendered with the given layout parameters"""
+        digest = hashlib.sha256(file_sha256(receipt_path).encode())
+        digest.update(json.dumps(layout, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, f"{key}.pdf")
+
+    def get(self, key):
+        """Path of a cached fragment, or None"""
+        path = self._path(key)
+        try:
+            # Touching the fragment marks it as recently used for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def put(self, key, render, work_dir=None):
+        """Call render(path) to write a fragment and move it into the cache; returns its path.
+
+        With work_dir the fragment is rendered there and moved over once it is complete.
+        """
+        tmp_path = os.path.join(work_dir or self.root, f".tmp-{uuid.uuid4()}.pdf")
+        try:
+            render(tmp_path)
+            move_into(tmp_path, self._path(key))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return self._path(key)
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.name.startswith('.') or not entry.name.endswith('.pdf'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        """Remove least recently used fragments until the cache fits its size cap"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    def purge(self, older_than):
+        """Remove fragments not used since the given timestamp, and abandoned renders"""
+        for entry in os.scandir(self.root):
+            try:
+                if entry.stat().st_mtime < older_than:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+        }
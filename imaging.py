@@ -0,0 +1,41 @@
+#!/usr/bin/python3
+
+import os
+from PIL import Image as PILImage, ImageOps
+
+# Receipts are shown at most 6.5" x 7" in the report
+RECEIPT_BOX_INCHES = (6.5, 7)
+
+
+def target_pixels(dpi):
+    """Pixel box a receipt image needs to fill the report's image area at the given DPI"""
+    return int(RECEIPT_BOX_INCHES[0] * dpi), int(RECEIPT_BOX_INCHES[1] * dpi)
+
+
+def normalize_receipt_image(src_path, dst_path, dpi=200, quality=85):
+    """Downscale, EXIF-rotate and re-encode a receipt photo as JPEG; return bytes saved"""
+    max_width, max_height = target_pixels(dpi)
+
+    with PILImage.open(src_path) as img:
+        # JPEG draft mode lets libjpeg decode straight to a reduced scale (1/2, 1/4, 1/8)
+        # instead of expanding the full 12-48 MP bitmap first. Orientation may swap the
+        # axes, so ask for at least the larger side in both directions.
+        if img.format == 'JPEG':
+            longest = max(max_width, max_height)
+            img.draft('RGB', (longest, longest))
+
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_width, max_height), PILImage.LANCZOS)
+
+        if img.mode in ('RGBA', 'LA', 'P'):
+            # Flatten transparency onto white paper rather than JPEG's default black
+            img = img.convert('RGBA')
+            background = PILImage.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.split()[-1])
+            img = background
+        elif img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+
+        img.save(dst_path, 'JPEG', quality=quality, optimize=True, progressive=True)
+
+    return os.path.getsize(src_path) - os.path.getsize(dst_path)
@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_expires ON files (expires_at);
+CREATE TABLE IF NOT EXISTS totals (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def path_size(path):
+    """Bytes used by a file, or by every file under a directory"""
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(path)
+            for name in names
+        )
+    return os.path.getsize(path)
+
+
+class FileManifest:
+    """Index of stored files and when each one expires"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def record(self, path, kind, retention_seconds, size=None):
+        """Add a file (or directory) to the manifest, or push back its expiry if it is already there"""
+        now = time.time()
+        if size is None:
+            size = path_size(path)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO files (path, kind, size, created_at, expires_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET size = excluded.size, expires_at = excluded.expires_at",
+                (path, kind, size, now, now + retention_seconds)
+            )
+
+    def sweep(self, now=None, batch_size=500):
+        """Delete every entry that is due, one batch at a time; return counts reclaimed"""
+        now = time.time() if now is None else now
+        reclaimed = {'files': 0, 'bytes': 0}
+        while True:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    'SELECT path, size FROM files WHERE expires_at <= ? ORDER BY expires_at LIMIT ?',
+                    (now, batch_size)
+                ).fetchall()
+            if not rows:
+                break
+
+            for path, size in rows:
+                try:
+                    if os.path.isdir(path):
+                        shutil.rmtree(path)
+                    else:
+                        os.remove(path)
+                    reclaimed['files'] += 1
+                    reclaimed['bytes'] += size
+                except FileNotFoundError:
+                    # Already gone, e.g. evicted from the page cache
+                    pass
+                except OSError as e:
+                    print(f"Error removing expired file {path}: {e}")
+
+            with self._connect() as conn:
+                conn.executemany(
+                    'DELETE FROM files WHERE path = ? AND expires_at <= ?',
+                    [(path, now) for path, _ in rows]
+                )
+            if len(rows) < batch_size:
+                break
+
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO totals (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                [('files_reclaimed', reclaimed['files']), ('bytes_freed', reclaimed['bytes'])]
+            )
+        return reclaimed
+
+    def usage(self):
+        """Bytes recorded per kind of file that has not been swept yet"""
+        with self._connect() as conn:
+            return dict(conn.execute('SELECT kind, SUM(size) FROM files GROUP BY kind').fetchall())
+
+    def totals(self):
+        """Files reclaimed and bytes freed by every sweep so far"""
+        with self._connect() as conn:
+            totals = dict(conn.execute('SELECT name, value FROM totals').fetchall())
+        return {'files_reclaimed': totals.get('files_reclaimed', 0), 'bytes_freed': totals.get('bytes_freed', 0)}
+
+
+class ExpirySweeper:
+    """Background thread that runs a sweep function on a fixed interval"""
+
+    def __init__(self, sweep, interval):
+        self.sweep = sweep
+        self.interval = interval
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the sweeper once per process (again after a fork)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run, name='expiry-sweeper', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Expiry sweep error: {e}")
@@ -0,0 +1,188 @@
+#!/usr/bin/python3
+
+import json
+import os
+from contextlib import contextmanager
+import sqlite3
+import threading
+import time
+import uuid
+
+# A job stuck in 'running' longer than this is assumed to belong to a
+# worker that died (process recycle, crash) and is handed out again
+DEFAULT_STALE_SECONDS = 600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class JobQueue:
+    """Durable FIFO of report jobs stored in SQLite"""
+
+    def __init__(self, db_path, stale_seconds=DEFAULT_STALE_SECONDS):
+        self.db_path = db_path
+        self.stale_seconds = stale_seconds
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, payload):
+        """Persist a job and return its id"""
+        job_id = str(uuid.uuid4())
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, payload, created_at) VALUES (?, 'queued', ?, ?)",
+                (job_id, json.dumps(payload), time.time())
+            )
+        return job_id
+
+    def claim(self):
+        """Atomically take the oldest runnable job, or return None"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' OR (status = 'running' AND started_at < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (now - self.stale_seconds,)
+                ).fetchone()
+                if row is None:
+                    conn.execute('COMMIT')
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    (now, row['id'])
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return {'id': row['id'], 'payload': json.loads(row['payload'])}
+
+    def finish(self, job_id, result):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, finished_at = ? WHERE id = ?",
+                (json.dumps(result), time.time(), job_id)
+            )
+
+    def fail(self, job_id, error):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                (str(error), time.time(), job_id)
+            )
+
+    def depth(self):
+        """Number of jobs waiting to be picked up"""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def status(self, job_id):
+        """Return a status dict for a job, or None if it is unknown"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None:
+                return None
+            info = {
+                'id': row['id'],
+                'status': row['status'],
+                'attempts': row['attempts'],
+                'queue_position': None,
+                'wait_seconds': None,
+                'build_seconds': None,
+                'result': json.loads(row['result']) if row['result'] else None,
+                'error': row['error'],
+            }
+            now = time.time()
+            if row['status'] == 'queued':
+                info['queue_position'] = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?",
+                    (row['created_at'],)
+                ).fetchone()[0] + 1
+                info['wait_seconds'] = round(now - row['created_at'], 3)
+            else:
+                info['wait_seconds'] = round(row['started_at'] - row['created_at'], 3)
+                end = row['finished_at'] if row['finished_at'] else now
+                info['build_seconds'] = round(end - row['started_at'], 3)
+            return info
+
+    def purge(self, older_than):
+        """Delete finished jobs that completed before the given timestamp"""
+        with self._connect() as conn:
+            cur = conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (older_than,)
+            )
+            return cur.rowcount
+
+
+class WorkerPool:
+    """Background threads that pull jobs from a JobQueue and run a handler"""
+
+    def __init__(self, queue, handler, workers=2, poll_interval=0.5):
+        self.queue = queue
+        self.handler = handler
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._threads = []
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the worker threads once per process"""
+        with self._lock:
+            # Threads do not survive a fork, so restart them in the child
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                t = threading.Thread(target=self.run, name=f"report-worker-{len(self._threads)}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def stop(self):
+        self._stop.set()
+
+    def run_once(self):
+        """Process a single job; return False if the queue was empty"""
+        job = self.queue.claim()
+        if job is None:
+            return False
+        try:
+            result = self.handler(job['payload'])
+            self.queue.finish(job['id'], result)
+        except Exception as e:
+            print(f"Error running job {job['id']}: {e}")
+            self.queue.fail(job['id'], e)
+        return True
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                if not self.run_once():
+                    self._stop.wait(self.poll_interval)
+            except Exception as e:
+                print(f"Report worker error: {e}")
+                self._stop.wait(self.poll_interval)
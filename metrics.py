@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; spans a cached fast render up to a slow multi-receipt build
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """In-process counters, histograms and gauges, rendered in the Prometheus text format"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._help = {}
+        self._types = {}
+        self._counters = {}
+        self._histograms = {}
+        self._readers = {}
+        self._lock = threading.Lock()
+
+    def _declare(self, name, kind, help_text):
+        if name not in self._types:
+            self._types[name] = kind
+            self._help[name] = help_text or name
+
+    def inc(self, name, amount=1, help_text=None, **labels):
+        """Add to a counter"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._declare(name, 'counter', help_text)
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, help_text=None, **labels):
+        """Record one value in a histogram"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._declare(name, 'histogram', help_text)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def gauge(self, name, read, help_text=None):
+        """Register a gauge read at scrape time; read() returns a number or {label tuple: number}"""
+        with self._lock:
+            self._declare(name, 'gauge', help_text)
+            self._readers[name] = read
+
+    def counter(self, name, read, help_text=None):
+        """Register a counter kept elsewhere (e.g. in a database) and read at scrape time, like gauge()"""
+        with self._lock:
+            self._declare(name, 'counter', help_text)
+            self._readers[name] = read
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: dict(h, buckets=list(h['buckets'])) for key, h in self._histograms.items()}
+            readers = dict(self._readers)
+            types = dict(self._types)
+            helps = dict(self._help)
+
+        samples = {name: [] for name in types}
+        for (name, labels), value in sorted(counters.items()):
+            samples[name].append(f"{name}{_label_text(labels)} {_format_value(value)}")
+        for (name, labels), histogram in sorted(histograms.items(), key=lambda item: item[0]):
+            for bound, count in zip(self.buckets, histogram['buckets']):
+                samples[name].append(f"{name}_bucket{_label_text(labels + (('le', _format_value(float(bound))),))} {count}")
+            samples[name].append(f"{name}_bucket{_label_text(labels + (('le', '+Inf'),))} {histogram['count']}")
+            samples[name].append(f"{name}_sum{_label_text(labels)} {_format_value(histogram['sum'])}")
+            samples[name].append(f"{name}_count{_label_text(labels)} {histogram['count']}")
+        for name, read in readers.items():
+            try:
+                value = read()
+            except Exception as e:
+                print(f"Error reading {types[name]} {name}: {e}")
+                continue
+            if isinstance(value, dict):
+                for labels, item in value.items():
+                    samples[name].append(f"{name}{_label_text(labels)} {_format_value(item)}")
+            else:
+                samples[name].append(f"{name} {_format_value(value)}")
+
+        lines = []
+        for name in sorted(samples):
+            lines.append(f"# HELP {name} {helps[name]}")
+            lines.append(f"# TYPE {name} {types[name]}")
+            lines.extend(samples[name])
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+# Stage timings of whatever request or job the current thread is handling
+_trace = threading.local()
+
+
+def begin_trace():
+    """Start collecting stage timings for this thread's request or job"""
+    _trace.stages = {}
+
+
+def end_trace():
+    """Stop collecting and return {stage: seconds} for this thread"""
+    stages = getattr(_trace, 'stages', None) or {}
+    _trace.stages = None
+    return stages
+
+
+def stage_error(name):
+    """Count a failure in a stage, including ones that are caught and worked around"""
+    metrics.inc('scout_stage_errors_total', help_text='Stage failures, by stage', stage=name)
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage into the stage histogram, counting it as an error if it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_error(name)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        metrics.observe('scout_stage_seconds', seconds, help_text='Time spent in each pipeline stage', stage=name)
+        stages = getattr(_trace, 'stages', None)
+        if stages is not None:
+            stages[name] = round(stages.get(name, 0) + seconds, 6)
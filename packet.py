@@ -0,0 +1,196 @@
+#!/usr/bin/python3
+
+import hashlib
+import io
+from PyPDF2 import PdfReader
+from PyPDF2.generic import (ArrayObject, DictionaryObject, IndirectObject, NameObject, NullObject, NumberObject,
+                            StreamObject, TextStringObject)
+
+# Object numbers fixed up front; everything copied from the documents comes after them
+CATALOG = 1
+PAGES = 2
+OUTLINES = 3
+
+
+def _ref(number):
+    return IndirectObject(number, 0, None)
+
+
+class PacketWriter:
+    """Joins finished PDFs page for page into one file, written front to back as it goes.
+
+    Each document's objects are copied out of its PdfReader, renumbered and written
+    immediately, and the reader is dropped before the next document is opened. Only
+    object offsets, page numbers and object hashes are kept, so memory stays around
+    the size of the largest document rather than the packet. Objects that come out
+    byte for byte the same (fonts, page templates, a photo in two reports) are
+    written once.
+    """
+
+    def __init__(self):
+        self.offsets = {}
+        self.position = 0
+        self.next_number = OUTLINES + 1
+        self.page_numbers = []
+        self.outline = []
+        self.object_numbers = {}
+        self.duplicates = 0
+        self._buffer = io.BytesIO()
+
+    def _write(self, data):
+        self._buffer.write(data)
+        self.position += len(data)
+
+    def _drain(self):
+        data = self._buffer.getvalue()
+        self._buffer = io.BytesIO()
+        return data
+
+    def _allocate(self):
+        number = self.next_number
+        self.next_number += 1
+        return number
+
+    def _emit(self, number, value):
+        self.offsets[number] = self.position
+        self._write(f"{number} 0 obj\n".encode())
+        start = self._buffer.tell()
+        value.write_to_stream(self._buffer, None)
+        self.position += self._buffer.tell() - start
+        self._write(b"\nendobj\n")
+
+    def _copy(self, value, mapping):
+        """value with every indirect reference pointing at the packet's copy of the object"""
+        if isinstance(value, IndirectObject):
+            return _ref(self._copy_object(value, mapping))
+        if isinstance(value, StreamObject):
+            raise ValueError("Streams must be indirect objects")
+        if isinstance(value, DictionaryObject):
+            copy = DictionaryObject()
+            for key, item in value.items():
+                copy[NameObject(key)] = self._copy(item, mapping)
+            return copy
+        if isinstance(value, ArrayObject):
+            return ArrayObject(self._copy(item, mapping) for item in value)
+        return value
+
+    def _copy_object(self, reference, mapping):
+        """Write the packet's copy of one of the document's objects; returns its number.
+
+        Children are written first, so an object's bytes are final once its references are
+        renumbered; an object identical to one already written is not written again.
+        """
+        key = (reference.idnum, reference.generation)
+        if key in mapping:
+            number, cyclic = mapping[key]
+            if cyclic is not None:
+                # Referenced from inside itself, so it can no longer be swapped for a duplicate
+                cyclic.append(key)
+            return number
+
+        obj = reference.get_object()
+        number = self._allocate()
+        cyclic = []
+        mapping[key] = (number, cyclic)
+        if obj is None:
+            # A reference to a missing object reads as null
+            copy = NullObject()
+        elif isinstance(obj, StreamObject):
+            copy = StreamObject()
+            for item_key, item in obj.items():
+                if item_key != '/Length':
+                    copy[NameObject(item_key)] = self._copy(item, mapping)
+            copy._data = obj._data
+        else:
+            copy = self._copy(obj, mapping)
+
+        body = io.BytesIO()
+        copy.write_to_stream(body, None)
+        digest = hashlib.sha256(body.getvalue()).hexdigest()
+        existing = self.object_numbers.get(digest)
+        if existing is not None and not cyclic:
+            # The number just taken stays unused; the xref lists it as free
+            mapping[key] = (existing, None)
+            self.duplicates += 1
+            return existing
+        self.object_numbers.setdefault(digest, number)
+        mapping[key] = (number, None)
+        self._emit(number, copy)
+        return number
+
+    def add_document(self, source, title=None):
+        """Append every page of a PDF (path or file object); returns the packet page number it starts on"""
+        reader = PdfReader(source)
+        start = len(self.page_numbers) + 1
+        mapping = {}
+        for page in reader.pages:
+            number = self._allocate()
+            original = page.indirect_reference
+            if original is not None:
+                # Annotations point back at their page
+                mapping[(original.idnum, original.generation)] = (number, None)
+            copy = DictionaryObject()
+            for key, item in page.items():
+                if key != '/Parent':
+                    copy[NameObject(key)] = self._copy(item, mapping)
+            copy[NameObject('/Parent')] = _ref(PAGES)
+            self._emit(number, copy)
+            self.page_numbers.append(number)
+        if title and len(self.page_numbers) >= start:
+            self.outline.append((title, self.page_numbers[start - 1]))
+        return start
+
+    def _finish(self):
+        kids = ArrayObject(_ref(number) for number in self.page_numbers)
+        self._emit(PAGES, DictionaryObject({
+            NameObject('/Type'): NameObject('/Pages'),
+            NameObject('/Kids'): kids,
+            NameObject('/Count'): NumberObject(len(kids)),
+        }))
+
+        # One bookmark per document, in order
+        items = [self._allocate() for _ in self.outline]
+        for i, (title, page_number) in enumerate(self.outline):
+            item = DictionaryObject({
+                NameObject('/Title'): TextStringObject(title),
+                NameObject('/Parent'): _ref(OUTLINES),
+                NameObject('/Dest'): ArrayObject([_ref(page_number), NameObject('/Fit')]),
+            })
+            if i > 0:
+                item[NameObject('/Prev')] = _ref(items[i - 1])
+            if i < len(items) - 1:
+                item[NameObject('/Next')] = _ref(items[i + 1])
+            self._emit(items[i], item)
+        outlines = DictionaryObject({NameObject('/Type'): NameObject('/Outlines'),
+                                     NameObject('/Count'): NumberObject(len(items))})
+        if items:
+            outlines[NameObject('/First')] = _ref(items[0])
+            outlines[NameObject('/Last')] = _ref(items[-1])
+        self._emit(OUTLINES, outlines)
+
+        self._emit(CATALOG, DictionaryObject({
+            NameObject('/Type'): NameObject('/Catalog'),
+            NameObject('/Pages'): _ref(PAGES),
+            NameObject('/Outlines'): _ref(OUTLINES),
+            NameObject('/PageMode'): NameObject('/UseOutlines'),
+        }))
+
+        xref_position = self.position
+        self._write(f"xref\n0 {self.next_number}\n".encode())
+        self._write(b"0000000000 65535 f \n")
+        for number in range(1, self.next_number):
+            if number in self.offsets:
+                self._write(f"{self.offsets[number]:010d} 00000 n \n".encode())
+            else:
+                self._write(b"0000000000 00000 f \n")
+        self._write(f"trailer\n<< /Size {self.next_number} /Root {CATALOG} 0 R >>\n"
+                    f"startxref\n{xref_position}\n%%EOF\n".encode())
+
+    def chunks(self, documents):
+        """Yield the packet for [(source, bookmark title or None)] one document at a time"""
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        for source, title in documents:
+            self.add_document(source, title)
+            yield self._drain()
+        self._finish()
+        yield self._drain()
@@ -0,0 +1,191 @@
+#!/usr/bin/python3
+
+import base64
+import hashlib
+import os
+import shutil
+import subprocess
+import zlib
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, NullObject, StreamObject
+
+# Streams smaller than this are not worth a Flate header
+MIN_COMPRESS_BYTES = 64
+
+
+def _stream_key(stream):
+    """Identity of a stream object: its dictionary (less /Length) and its encoded bytes"""
+    entries = sorted((key, repr(value)) for key, value in stream.items() if key != '/Length')
+    digest = hashlib.sha256(repr(entries).encode())
+    digest.update(stream._data)
+    return digest.hexdigest()
+
+
+def _remap(value, replacements):
+    """Point references to duplicate objects at the copy being kept, in place"""
+    if isinstance(value, DictionaryObject):
+        for key, item in list(value.items()):
+            if isinstance(item, IndirectObject) and item.idnum in replacements:
+                value[key] = replacements[item.idnum]
+            else:
+                _remap(item, replacements)
+    elif isinstance(value, ArrayObject):
+        for i, item in enumerate(value):
+            if isinstance(item, IndirectObject) and item.idnum in replacements:
+                value[i] = replacements[item.idnum]
+            else:
+                _remap(item, replacements)
+
+
+def _deduplicate(writer):
+    """Keep one copy of each identical stream (images, fonts, content); returns the number dropped"""
+    # PyPDF2 3.x keeps the writer's objects in a list indexed by object number - 1
+    objects = writer._objects
+    dropped = 0
+    while True:
+        seen = {}
+        replacements = {}
+        for index, obj in enumerate(objects):
+            if not isinstance(obj, StreamObject):
+                continue
+            key = _stream_key(obj)
+            if key in seen:
+                replacements[index + 1] = seen[key]
+            else:
+                seen[key] = IndirectObject(index + 1, 0, writer)
+        if not replacements:
+            return dropped
+        for obj in objects:
+            _remap(obj, replacements)
+        # A null keeps the object numbering (and so the xref table) intact
+        for idnum in replacements:
+            objects[idnum - 1] = NullObject()
+        dropped += len(replacements)
+        # Deduplicating e.g. soft masks can make the images that use them identical too
+
+
+def _filters(stream):
+    """The stream's filters and their decode parameters (None where there are none) as two lists"""
+    filters = stream.get('/Filter')
+    if filters is None:
+        return [], []
+    if not isinstance(filters, ArrayObject):
+        filters = [filters]
+    parms = stream.get('/DecodeParms')
+    if not isinstance(parms, ArrayObject):
+        parms = [parms] + [None] * (len(filters) - 1)
+    parms = [None if isinstance(p, NullObject) else p for p in parms]
+    return list(filters), (parms + [None] * len(filters))[:len(filters)]
+
+
+def _set_filters(stream, filters, parms):
+    for key in ('/Filter', '/DecodeParms'):
+        if key in stream:
+            del stream[key]
+    if len(filters) == 1:
+        stream[NameObject('/Filter')] = NameObject(filters[0])
+    elif filters:
+        stream[NameObject('/Filter')] = ArrayObject(NameObject(f) for f in filters)
+    if any(p is not None for p in parms):
+        if len(parms) == 1:
+            stream[NameObject('/DecodeParms')] = parms[0]
+        else:
+            stream[NameObject('/DecodeParms')] = ArrayObject(NullObject() if p is None else p for p in parms)
+
+
+def _recompress(writer, level):
+    """Drop ASCII85 layers, Flate-compress unfiltered streams and recompress Flate ones at level; returns bytes saved
+
+    ReportLab wraps every stream in ASCII85 by default ([/ASCII85Decode /FlateDecode] for
+    page content, [/ASCII85Decode /DCTDecode] for JPEG photos), which makes it a quarter
+    bigger than the bytes inside. Filters other than Flate, such as DCT, are kept as they are.
+    """
+    saved = 0
+    for obj in writer._objects:
+        if not isinstance(obj, StreamObject) or obj.get('/Type') == '/Metadata':
+            continue
+        data = obj._data
+        filters, parms = _filters(obj)
+        if filters[:1] == ['/ASCII85Decode']:
+            try:
+                data = base64.a85decode(data.strip(), adobe=True)
+            except ValueError:
+                continue
+            filters, parms = filters[1:], parms[1:]
+
+        if not filters:
+            if len(data) >= MIN_COMPRESS_BYTES:
+                compressed = zlib.compress(data, level)
+                if len(compressed) < len(data):
+                    data, filters, parms = compressed, ['/FlateDecode'], [None]
+        elif filters[0] == '/FlateDecode':
+            # Predictors (/DecodeParms) apply to the inflated bytes, so they carry over unchanged
+            try:
+                compressed = zlib.compress(zlib.decompress(data), level)
+            except zlib.error:
+                continue
+            if len(compressed) < len(data):
+                data = compressed
+
+        if len(data) < len(obj._data):
+            saved += len(obj._data) - len(data)
+            obj._data = data
+            _set_filters(obj, filters, parms)
+    return saved
+
+
+def linearize(path):
+    """Rewrite a PDF for fast web view with qpdf; returns False if qpdf is not installed or fails"""
+    qpdf = shutil.which('qpdf')
+    if qpdf is None:
+        return False
+    tmp_path = f"{path}.linearizing"
+    result = subprocess.run(
+        [qpdf, '--linearize', '--object-streams=generate', path, tmp_path],
+        capture_output=True, text=True
+    )
+    # Exit status 3 means qpdf succeeded with warnings
+    if result.returncode not in (0, 3) or not os.path.exists(tmp_path):
+        print(f"Error linearizing {path}: {result.stderr.strip()}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+    os.replace(tmp_path, path)
+    return True
+
+
+def optimize_pdf(path, compression_level=9, linearize_output=False, recompress=True):
+    """Shrink a finished PDF in place; returns sizes and what was done.
+
+    Identical streams are stored once and, unless recompress is False, streams are
+    (re)compressed at compression_level. The result is only kept if it is smaller. Fonts
+    are left as they are: ReportLab embeds subsets of TrueType fonts and none of the
+    standard 14.
+    """
+    before = os.path.getsize(path)
+    reader = PdfReader(path)
+    writer = PdfWriter()
+    for page in reader.pages:
+        writer.add_page(page)
+    if reader.metadata:
+        writer.add_metadata(reader.metadata)
+
+    duplicates = _deduplicate(writer)
+    recompressed = _recompress(writer, compression_level) if recompress else 0
+
+    tmp_path = f"{path}.optimizing"
+    with open(tmp_path, 'wb') as f:
+        writer.write(f)
+    if os.path.getsize(tmp_path) < before:
+        os.replace(tmp_path, path)
+    else:
+        os.remove(tmp_path)
+
+    linearized = linearize(path) if linearize_output else False
+    return {
+        'before': before,
+        'after': os.path.getsize(path),
+        'duplicates': duplicates,
+        'recompressed_bytes': recompressed,
+        'linearized': linearized,
+    }
@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+
+import os
+import re
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import Flowable
+from PyPDF2 import PdfReader, PdfWriter
+
+
+def count_pdf_pages(pdf_path):
+    """Return the page count of a PDF that can be merged as-is, or None if it is malformed"""
+    try:
+        reader = PdfReader(pdf_path)
+        if reader.is_encrypted and not reader.decrypt(''):
+            return None
+        # Touch every page so broken page trees fail here rather than during the merge
+        for page in reader.pages:
+            page.mediabox
+        return len(reader.pages) or None
+    except Exception as e:
+        print(f"PDF receipt {pdf_path} cannot be merged, rasterizing instead: {e}")
+        return None
+
+
+def probe_pdf_pages(pdf_path, max_pages):
+    """Return (page count, largest (width, height) in points among the first max_pages), or None if unreadable.
+
+    Nothing is rendered: poppler's pdfinfo reads the page tree, and PyPDF2 stands in
+    when poppler cannot.
+    """
+    try:
+        from pdf2image import pdfinfo_from_path
+        info = pdfinfo_from_path(pdf_path, first_page=1, last_page=max_pages)
+        page_count = int(info['Pages'])
+        sizes = []
+        for key, value in info.items():
+            # With a page range pdfinfo prints "Page    N size: 612 x 792 pts (letter)"
+            match = re.match(r'Page\s+\d+\s+size$', key) and re.match(r'([\d.]+) x ([\d.]+)', value)
+            if match:
+                sizes.append((float(match.group(1)), float(match.group(2))))
+    except Exception:
+        try:
+            reader = PdfReader(pdf_path)
+            if reader.is_encrypted and not reader.decrypt(''):
+                return None
+            page_count = len(reader.pages)
+            sizes = [(float(page.mediabox.width), float(page.mediabox.height))
+                     for page in reader.pages[:max_pages]]
+        except Exception as e:
+            print(f"Error reading page count of {pdf_path}: {e}")
+            return None
+    if not page_count:
+        return None
+    return page_count, max(sizes or [letter], key=lambda size: size[0] * size[1])
+
+
+class ReceiptMarker(Flowable):
+    """Zero-size flowable that records which page a merged PDF receipt follows"""
+
+    def __init__(self, pdf_path):
+        Flowable.__init__(self)
+        self.pdf_path = pdf_path
+        self.page_number = None
+
+    def wrap(self, availWidth, availHeight):
+        return 0, 0
+
+    def draw(self):
+        self.page_number = self.canv.getPageNumber()
+
+
+def merge_pdf_receipts(report_path, markers):
+    """Insert the original receipt pages after the page each marker landed on"""
+    inserts = {}
+    for marker in markers:
+        inserts.setdefault(marker.page_number, []).append(marker.pdf_path)
+
+    writer = PdfWriter()
+    for page_number, page in enumerate(PdfReader(report_path).pages, start=1):
+        writer.add_page(page)
+        for pdf_path in inserts.get(page_number, []):
+            reader = PdfReader(pdf_path)
+            if reader.is_encrypted:
+                reader.decrypt('')
+            for receipt_page in reader.pages:
+                writer.add_page(receipt_page)
+
+    merged_path = f"{report_path}.merging"
+    with open(merged_path, 'wb') as f:
+        writer.write(f)
+    os.replace(merged_path, report_path)
+
+
+def concatenate_pdfs(sources, output_path):
+    """Write the pages of several PDFs (paths or file objects), in order, to one file"""
+    writer = PdfWriter()
+    for source in sources:
+        for page in PdfReader(source).pages:
+            writer.add_page(page)
+
+    tmp_path = f"{output_path}.joining"
+    with open(tmp_path, 'wb') as f:
+        writer.write(f)
+    os.replace(tmp_path, output_path)
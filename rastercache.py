@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+
+INDEX_FILE = 'pages.json'
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Hex SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class RasterCache:
+    """Rasterized PDF pages stored by content hash and render settings, with LRU eviction"""
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, pdf_path, dpi, fmt, max_pages=None):
+        key = f"{file_sha256(pdf_path)}-{dpi}-{fmt.lower()}"
+        # Pages past the limit are not rendered, so a different limit is a different entry
+        return f"{key}-p{max_pages}" if max_pages else key
+
+    def _load(self, key):
+        entry_dir = os.path.join(self.root, key)
+        try:
+            with open(os.path.join(entry_dir, INDEX_FILE)) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Touching the entry marks it as recently used for eviction
+        os.utime(entry_dir)
+        return [os.path.join(entry_dir, name) for name in index['pages']]
+
+    def get_or_create(self, pdf_path, dpi, fmt, render, max_pages=None, work_dir=None):
+        """Return cached page paths, calling render(output_folder) to fill the cache on a miss.
+
+        With work_dir the pages are rendered there (e.g. a per-build scratch directory on a
+        tmpfs) and only a finished set is moved into the cache.
+        """
+        key = self.key(pdf_path, dpi, fmt, max_pages)
+        pages = self._load(key)
+        if pages is not None:
+            with self._lock:
+                self.hits += 1
+            return pages
+        with self._lock:
+            self.misses += 1
+
+        # Render into a private directory, then move it into place in one step
+        tmp_dir = os.path.join(self.root, f".tmp-{uuid.uuid4()}")
+        render_dir = os.path.join(work_dir, f"pages-{uuid.uuid4()}") if work_dir else tmp_dir
+        os.makedirs(render_dir)
+        try:
+            rendered = render(render_dir)
+            if not rendered:
+                return []
+            size = sum(os.path.getsize(p) for p in rendered)
+            with open(os.path.join(render_dir, INDEX_FILE), 'w') as f:
+                json.dump({'pages': [os.path.basename(p) for p in rendered], 'bytes': size}, f)
+            if render_dir != tmp_dir:
+                # Copied over if the work directory is on another filesystem
+                shutil.move(render_dir, tmp_dir)
+            try:
+                os.rename(tmp_dir, os.path.join(self.root, key))
+            except OSError:
+                # Another worker cached the same document first
+                pass
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            shutil.rmtree(render_dir, ignore_errors=True)
+
+        self.evict()
+        return self._load(key) or []
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.root):
+            if not entry.is_dir() or entry.name.startswith('.'):
+                continue
+            try:
+                with open(os.path.join(entry.path, INDEX_FILE)) as f:
+                    size = json.load(f)['bytes']
+                entries.append((entry.stat().st_mtime, size, entry.path))
+            except (OSError, ValueError, KeyError):
+                continue
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits its size cap"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    def purge(self, older_than):
+        """Remove entries not used since the given timestamp"""
+        for mtime, _, path in self._entries():
+            if mtime < older_than:
+                shutil.rmtree(path, ignore_errors=True)
+        # Leftovers from renders that were interrupted
+        for entry in os.scandir(self.root):
+            if entry.name.startswith('.tmp-') and entry.stat().st_mtime < older_than:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+        }
@@ -0,0 +1,168 @@
+#!/usr/bin/python3
+
+import copy
+from functools import lru_cache
+from reportlab.lib import colors
+from reportlab.lib.units import inch
+from reportlab.platypus import TableStyle, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.enums import TA_CENTER
+
+
+class ReportTemplate:
+    """Immutable styles, column widths and boilerplate shared by every expense report"""
+
+    def __init__(self):
+        styles = getSampleStyleSheet()
+
+        self.title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=18,
+            textColor=colors.HexColor('#000000'),
+            spaceAfter=10,
+            alignment=TA_CENTER
+        )
+
+        self.warning_style = ParagraphStyle(
+            'WarningStyle',
+            parent=styles['Normal'],
+            fontSize=12,
+            textColor=colors.HexColor('#a70000'),
+            spaceAfter=10,
+            alignment=TA_CENTER,
+            fontName='Helvetica-Bold'
+        )
+
+        self.header_style = ParagraphStyle(
+            'CustomHeader',
+            parent=styles['Normal'],
+            fontSize=12,
+            spaceAfter=6
+        )
+
+        self.signature_style = ParagraphStyle(
+            'SignatureStyle',
+            parent=styles['Normal'],
+            fontSize=11,
+            spaceAfter=8
+        )
+
+        self.purchase_header_style = ParagraphStyle(
+            'PurchaseHeader',
+            parent=styles['Normal'],
+            fontSize=12,
+            fontName='Helvetica-Bold',
+            textColor=colors.HexColor('#003f87'),
+            spaceAfter=10
+        )
+
+        # Column widths
+        self.event_col_widths = [2*inch, 4.5*inch]
+        self.purchase_col_widths = [1.2*inch, 1.8*inch, 3*inch, 1*inch]
+        self.mileage_col_widths = [1*inch, 1.8*inch, 1.8*inch, 0.8*inch, 1.6*inch]
+        self.total_col_widths = [5*inch, 2*inch]
+        self.signature_col_widths = [2*inch, 4.5*inch]
+        self.packet_col_widths = [0.35*inch, 1.3*inch, 1.25*inch, 0.8*inch, 0.8*inch, 0.75*inch, 0.8*inch, 0.4*inch]
+
+        # Table styles
+        self.event_table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+            ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+            ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('LEFTPADDING', (0, 0), (-1, -1), 6),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+            ('TOPPADDING', (0, 0), (-1, -1), 6),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+        ])
+
+        # Purchases and mileage share the same header/total-row look
+        self.line_item_table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ])
+
+        self.total_table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, -1), colors.lightgrey),
+            ('ALIGN', (0, 0), (0, 0), 'RIGHT'),
+            ('ALIGN', (1, 0), (1, 0), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 12),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('TOPPADDING', (0, 0), (-1, -1), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
+        ])
+
+        self.signature_table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+            ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+            ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+            ('FONTNAME', (1, 0), (1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('LEFTPADDING', (0, 0), (-1, -1), 8),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+            ('TOPPADDING', (0, 0), (-1, -1), 8),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+        ])
+
+        # Static boilerplate, parsed once
+        self._heading = [
+            Paragraph("TROOP 233/2233 EXPENSE REIMBURSEMENT", self.title_style),
+            Spacer(1, 0.1*inch),
+            # Warning about reimbursement
+            Paragraph("⚠️ IMPORTANT: Reimbursement will go to Requestor's account", self.warning_style),
+            Spacer(1, 0.1*inch),
+            Paragraph("NEXT STEPS: You MUST email this expense report to the treasurer through Troopweb Host in order to be reimbursed.", self.title_style),
+            Spacer(1, 0.2*inch),
+        ]
+
+        self._affirmation = [
+            Paragraph("SIGNATURE AND ACKNOWLEDGMENT", self.title_style),
+            Spacer(1, 0.15*inch),
+            Paragraph("By submitting this expense reimbursement report, I affirm that:", self.signature_style),
+            Paragraph("• All information provided is true, honest, and accurate to the best of my knowledge", self.signature_style),
+            Paragraph("• All expenses listed were incurred for legitimate Troop 233/2233 activities", self.signature_style),
+            Paragraph("• I have provided accurate receipts and supporting documentation", self.signature_style),
+            Paragraph("• I understand this submission is made in accordance with the Scout Law", self.signature_style),
+            Spacer(1, 0.15*inch),
+            Paragraph("<b>Scout Law:</b> <i>A Scout is Trustworthy, Loyal, Helpful, Friendly, Courteous, Kind, Obedient, Cheerful, Thrifty, Brave, Clean, and Reverent.</i>", self.signature_style),
+            Spacer(1, 0.2*inch),
+        ]
+
+        self._supporting_documents_title = [
+            Paragraph("SUPPORTING DOCUMENTS", self.title_style),
+            Spacer(1, 0.2*inch),
+        ]
+
+    # Flowables remember their layout while a document is built, so every
+    # report gets its own shallow copies of the pre-parsed boilerplate
+    def heading(self):
+        return [copy.copy(f) for f in self._heading]
+
+    def affirmation(self):
+        return [copy.copy(f) for f in self._affirmation]
+
+    def supporting_documents_title(self):
+        return [copy.copy(f) for f in self._supporting_documents_title]
+
+
+@lru_cache(maxsize=None)
+def get_report_template():
+    """The process-wide report template, built on first use"""
+    return ReportTemplate()
@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from rastercache import file_sha256
+
+# Spill files are copied from the build buffer in blocks of this size
+COPY_BYTES = 64 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    download_name TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    submission_id TEXT
+);
+CREATE INDEX IF NOT EXISTS reports_created ON reports (created_at);
+"""
+
+
+def add_column(conn, table, column):
+    """Add a column that databases created by earlier versions lack"""
+    existing = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+    if column.split()[0] not in existing:
+        try:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column}')
+        except sqlite3.OperationalError as e:
+            # Another process added it first
+            if 'duplicate column' not in str(e):
+                raise
+
+
+class ReportStore:
+    """Where each generated report is stored, with its friendly download name and content hash"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            add_column(conn, 'reports', 'submission_id TEXT')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def register(self, report_id, path, download_name, submission_id=None):
+        """Record a finished report; its SHA-256 becomes the download ETag.
+
+        submission_id is the submission an edited report was regenerated for; it defaults to the report's own id.
+        """
+        info = {
+            'id': report_id,
+            'path': path,
+            'download_name': download_name,
+            'sha256': file_sha256(path),
+            'size': os.path.getsize(path),
+            'created_at': time.time(),
+            'submission_id': submission_id or report_id,
+        }
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO reports (id, path, download_name, sha256, size, created_at, submission_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                tuple(info.values())
+            )
+        return info
+
+    def get(self, report_id):
+        """Metadata for a report, or None if it is unknown"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM reports WHERE id = ?', (report_id,)).fetchone()
+        return dict(row) if row else None
+
+    def purge(self, older_than):
+        """Forget reports created before a timestamp (their files are removed by the expiry sweep)"""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM reports WHERE created_at < ?', (older_than,))
+
+
+class MemoryReportCache:
+    """Bounded LRU of recently built reports for deployments that do not keep reports on disk.
+
+    Reports up to spill_bytes are held as bytes; larger ones are written to a file in
+    spill_folder, which is removed when the entry is evicted. Entries live only in
+    this process.
+    """
+
+    def __init__(self, max_bytes, spill_bytes, spill_folder):
+        self.max_bytes = max_bytes
+        self.spill_bytes = spill_bytes
+        self.spill_folder = spill_folder
+        self.used_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, report_id, report_file, download_name, submission_id=None):
+        """Keep a report read from a file object; returns the entry, with 'path' set if it was spilled to disk"""
+        size = report_file.seek(0, os.SEEK_END)
+        report_file.seek(0)
+        digest = hashlib.sha256()
+        entry = {
+            'id': report_id,
+            'download_name': download_name,
+            'submission_id': submission_id or report_id,
+            'size': size,
+            'created_at': time.time(),
+            'data': None,
+            'path': None,
+        }
+        if size > self.spill_bytes:
+            os.makedirs(self.spill_folder, exist_ok=True)
+            entry['path'] = os.path.join(self.spill_folder, f"{report_id}.pdf")
+            with open(entry['path'], 'wb') as f:
+                for block in iter(lambda: report_file.read(COPY_BYTES), b''):
+                    digest.update(block)
+                    f.write(block)
+        else:
+            entry['data'] = report_file.read()
+            digest.update(entry['data'])
+        entry['sha256'] = digest.hexdigest()
+
+        evicted = []
+        with self._lock:
+            self._entries[report_id] = entry
+            self.used_bytes += entry['size']
+            while self.used_bytes > self.max_bytes and len(self._entries) > 1:
+                _, old = self._entries.popitem(last=False)
+                self.used_bytes -= old['size']
+                evicted.append(old)
+        for old in evicted:
+            if old['path'] and os.path.exists(old['path']):
+                os.remove(old['path'])
+        return entry
+
+    def get(self, report_id):
+        """The cached entry for a report, marking it recently used, or None"""
+        with self._lock:
+            entry = self._entries.get(report_id)
+            if entry is not None:
+                self._entries.move_to_end(report_id)
+            return entry
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.used_bytes, 'max_bytes': self.max_bytes}
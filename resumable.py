@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from werkzeug.exceptions import BadRequest, Conflict, NotFound, RequestEntityTooLarge, UnprocessableEntity, UnsupportedMediaType
+from uploads import FILE_SIGNATURES, SNIFF_BYTES
+
+SESSION_ID = re.compile(r'^[0-9a-f]{32}$')
+SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+
+class ResumableUploads:
+    """Receipts sent in chunks, one session per file, assembled on disk and verified by SHA-256.
+
+    A session is two files in folder: <id>.json with the declared name, size and hash,
+    and <id>.part with the bytes received so far. The size of the .part file is the
+    resume offset, so a dropped connection loses at most the chunk in flight.
+    """
+
+    def __init__(self, folder, allowed_extensions, max_bytes, max_chunk_bytes):
+        self.folder = folder
+        self.allowed_extensions = allowed_extensions
+        self.max_bytes = max_bytes
+        self.max_chunk_bytes = max_chunk_bytes
+        os.makedirs(folder, exist_ok=True)
+
+    def _paths(self, upload_id):
+        if not SESSION_ID.match(upload_id or ''):
+            raise NotFound("Unknown upload")
+        base = os.path.join(self.folder, upload_id)
+        return f"{base}.json", f"{base}.part"
+
+    def _load(self, upload_id):
+        meta_path, _ = self._paths(upload_id)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise NotFound("Unknown upload")
+
+    def _save(self, session):
+        meta_path, _ = self._paths(session['id'])
+        tmp_path = f"{meta_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(session, f)
+        os.replace(tmp_path, meta_path)
+
+    def create(self, filename, size, sha256):
+        """Start a session for one file; returns its status"""
+        extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+        if extension not in self.allowed_extensions or extension not in FILE_SIGNATURES:
+            raise UnsupportedMediaType(f"File type not allowed: {filename}")
+        if not isinstance(size, int) or size <= 0:
+            raise BadRequest("size must be a positive number of bytes")
+        if size > self.max_bytes:
+            raise RequestEntityTooLarge(f"Each file must be under {self.max_bytes // (1024 * 1024)}MB")
+        if not SHA256.match(sha256 or ''):
+            raise BadRequest("sha256 must be the hex SHA-256 of the file")
+
+        session = {
+            'id': uuid.uuid4().hex,
+            'filename': filename,
+            'extension': extension,
+            'size': size,
+            'sha256': sha256,
+            'created_at': time.time(),
+            'path': None,
+        }
+        self._save(session)
+        open(self._paths(session['id'])[1], 'wb').close()
+        return self.status(session['id'])
+
+    def status(self, upload_id):
+        session = self._load(upload_id)
+        _, part_path = self._paths(upload_id)
+        if session['path']:
+            received = session['size']
+        else:
+            received = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        return {
+            'upload_id': upload_id,
+            'size': session['size'],
+            'received': received,
+            'complete': bool(session['path']),
+            'chunk_size': self.max_chunk_bytes,
+        }
+
+    def write_chunk(self, upload_id, offset, stream, length):
+        """Append a chunk that starts at offset; returns the bytes received so far"""
+        session = self._load(upload_id)
+        _, part_path = self._paths(upload_id)
+        if session['path']:
+            raise Conflict("Upload is already complete")
+        if length is None or length > self.max_chunk_bytes:
+            raise RequestEntityTooLarge(f"Chunks must be under {self.max_chunk_bytes} bytes")
+
+        received = os.path.getsize(part_path)
+        if offset != received:
+            # The client resends from what the server actually has
+            raise Conflict(f"Expected offset {received}")
+        if received + length > session['size']:
+            raise RequestEntityTooLarge("Chunk runs past the declared file size")
+
+        written = 0
+        with open(part_path, 'ab') as f:
+            while written < length:
+                data = stream.read(min(64 * 1024, length - written))
+                if not data:
+                    break
+                f.write(data)
+                written += len(data)
+        return received + written
+
+    def complete(self, upload_id, store):
+        """Verify the assembled file and hand it to store(path, sha256, extension), which returns its final path"""
+        session = self._load(upload_id)
+        if session['path']:
+            return session['path']
+        _, part_path = self._paths(upload_id)
+        if os.path.getsize(part_path) != session['size']:
+            raise Conflict("Upload is not finished")
+
+        digest = hashlib.sha256()
+        with open(part_path, 'rb') as f:
+            head = f.read(SNIFF_BYTES)
+            digest.update(head)
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        if digest.hexdigest() != session['sha256']:
+            # Start over rather than keep bytes that do not match what the browser hashed
+            open(part_path, 'wb').close()
+            raise UnprocessableEntity("Uploaded file does not match its SHA-256; please upload it again")
+        if not head.startswith(FILE_SIGNATURES[session['extension']]):
+            os.remove(part_path)
+            raise UnsupportedMediaType(f"File content is not a valid .{session['extension']} file")
+
+        session['path'] = store(part_path, session['sha256'], session['extension'])
+        self._save(session)
+        return session['path']
+
+    def receipt_path(self, upload_id):
+        """Stored path of a finished upload, or None if it is unknown or incomplete"""
+        try:
+            session = self._load(upload_id)
+        except NotFound:
+            return None
+        if session['path'] and os.path.exists(session['path']):
+            return session['path']
+        return None
+
+    def session_files(self, upload_id):
+        """The metadata and partial-data paths of a session, for the expiry manifest"""
+        return self._paths(upload_id)
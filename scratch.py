@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+
+import os
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+from werkzeug.exceptions import HTTPException
+from janitor import path_size
+
+
+class QuotaExceeded(HTTPException):
+    """507 Insufficient Storage: a storage area is at its disk quota"""
+    code = 507
+    description = "Storage is full; please try again later"
+
+
+def move_into(src, dest):
+    """Move a file into place in one step, even from another filesystem such as a tmpfs"""
+    staging = os.path.join(os.path.dirname(dest), f".{uuid.uuid4()}.moving")
+    try:
+        # A plain rename on the same filesystem, a copy otherwise
+        shutil.move(src, staging)
+        os.replace(staging, dest)
+    finally:
+        if os.path.exists(staging):
+            os.remove(staging)
+    return dest
+
+
+class ScratchSpace:
+    """Private working directories for report builds, each removed as soon as its build ends.
+
+    root may be on a tmpfs. The quota is checked when a workspace is handed out, so a
+    build already running can finish; new ones are refused until space is freed.
+    """
+
+    def __init__(self, root, quota_bytes):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.active = 0
+        self.created = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @contextmanager
+    def workspace(self):
+        """Yield a new empty directory, deleted afterwards whether or not the build succeeded"""
+        if self.quota_bytes and self.usage() >= self.quota_bytes:
+            raise QuotaExceeded("Scratch space is full; please try again shortly")
+        path = os.path.join(self.root, uuid.uuid4().hex)
+        os.makedirs(path)
+        with self._lock:
+            self.active += 1
+            self.created += 1
+        try:
+            yield path
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+            with self._lock:
+                self.active -= 1
+
+    def usage(self):
+        return path_size(self.root)
+
+    def purge(self, older_than):
+        """Remove workspaces left behind by a process that was killed mid-build"""
+        for entry in os.scandir(self.root):
+            try:
+                if entry.is_dir() and entry.stat().st_mtime < older_than:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        return {
+            'active': self.active,
+            'created': self.created,
+            'bytes': self.usage(),
+            'quota_bytes': self.quota_bytes,
+        }
@@ -0,0 +1,228 @@
+#!/usr/bin/python3
+
+import csv
+import io
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from reportstore import add_column
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    requestor TEXT NOT NULL,
+    email TEXT NOT NULL,
+    troop_number TEXT NOT NULL,
+    event_name TEXT NOT NULL,
+    event_date TEXT NOT NULL,
+    signature_name TEXT,
+    report_filename TEXT,
+    purchases REAL NOT NULL,
+    miles REAL NOT NULL,
+    mileage REAL NOT NULL,
+    grand REAL NOT NULL,
+    data TEXT NOT NULL,
+    report_id TEXT
+);
+CREATE INDEX IF NOT EXISTS submissions_event ON submissions (event_name, event_date);
+CREATE INDEX IF NOT EXISTS submissions_requestor ON submissions (requestor, event_date);
+CREATE INDEX IF NOT EXISTS submissions_troop ON submissions (troop_number, event_date);
+CREATE INDEX IF NOT EXISTS submissions_event_date ON submissions (event_date);
+
+-- One row per event/requestor/troop/date, kept up to date as submissions are recorded
+CREATE TABLE IF NOT EXISTS rollups (
+    event_name TEXT NOT NULL,
+    requestor TEXT NOT NULL,
+    troop_number TEXT NOT NULL,
+    event_date TEXT NOT NULL,
+    submissions INTEGER NOT NULL,
+    purchases REAL NOT NULL,
+    miles REAL NOT NULL,
+    mileage REAL NOT NULL,
+    grand REAL NOT NULL,
+    PRIMARY KEY (event_name, requestor, troop_number, event_date)
+);
+CREATE INDEX IF NOT EXISTS rollups_requestor ON rollups (requestor);
+CREATE INDEX IF NOT EXISTS rollups_troop ON rollups (troop_number);
+CREATE INDEX IF NOT EXISTS rollups_event_date ON rollups (event_date);
+"""
+
+# group_by / filter names accepted from the treasurer endpoints and CLI
+DIMENSIONS = {
+    'event': 'event_name',
+    'requestor': 'requestor',
+    'troop': 'troop_number',
+    'date': 'event_date',
+}
+MEASURES = ('submissions', 'purchases', 'miles', 'mileage', 'grand')
+
+
+class SubmissionStore:
+    """Structured copy of every submitted expense report, with running totals for rollups"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            add_column(conn, 'submissions', 'report_id TEXT')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def record(self, submission_id, data, signature_data, totals, report_filename=None, purchase_documents=None, report_id=None):
+        """Store one submission and add its totals to the rollups in the same transaction.
+
+        Recording an existing submission_id again (an edited resubmission) replaces it; report_id is its latest report.
+        """
+        row = {
+            'id': submission_id,
+            'created_at': time.time(),
+            'requestor': f"{data['requestor_first']} {data['requestor_last']}".strip(),
+            'email': data['email'],
+            'troop_number': data['troop_number'],
+            'event_name': data['event_name'],
+            'event_date': data['event_date'],
+            'signature_name': signature_data['name'] if signature_data else None,
+            'report_filename': report_filename,
+            'purchases': round(totals['purchases'], 2),
+            'miles': round(totals['miles'], 2),
+            'mileage': round(totals['mileage'], 2),
+            'grand': round(totals['grand'], 2),
+            'data': json.dumps({
+                'data': data,
+                'signature_data': signature_data,
+                'purchase_documents': {str(index): path for index, path in (purchase_documents or {}).items()},
+            }),
+            'report_id': report_id or submission_id,
+        }
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                previous = conn.execute('SELECT * FROM submissions WHERE id = ?', (submission_id,)).fetchone()
+                if previous is not None:
+                    # Re-recording a submission replaces its contribution to the rollups
+                    self._apply(conn, previous, -1)
+                    conn.execute('DELETE FROM submissions WHERE id = ?', (submission_id,))
+                columns = ', '.join(row)
+                conn.execute(
+                    f"INSERT INTO submissions ({columns}) VALUES ({', '.join('?' for _ in row)})",
+                    tuple(row.values())
+                )
+                self._apply(conn, row, 1)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def _apply(self, conn, row, sign):
+        conn.execute(
+            "INSERT INTO rollups (event_name, requestor, troop_number, event_date, submissions, purchases, miles, mileage, grand) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(event_name, requestor, troop_number, event_date) DO UPDATE SET "
+            "submissions = submissions + excluded.submissions, purchases = purchases + excluded.purchases, "
+            "miles = miles + excluded.miles, mileage = mileage + excluded.mileage, grand = grand + excluded.grand",
+            (row['event_name'], row['requestor'], row['troop_number'], row['event_date'],
+             sign, sign * row['purchases'], sign * row['miles'], sign * row['mileage'], sign * row['grand'])
+        )
+        conn.execute('DELETE FROM rollups WHERE submissions <= 0')
+
+    def rebuild_rollups(self):
+        """Recompute the rollups table from the submissions themselves"""
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute('DELETE FROM rollups')
+                conn.execute(
+                    "INSERT INTO rollups (event_name, requestor, troop_number, event_date, submissions, purchases, miles, mileage, grand) "
+                    "SELECT event_name, requestor, troop_number, event_date, COUNT(*), SUM(purchases), SUM(miles), SUM(mileage), SUM(grand) "
+                    "FROM submissions GROUP BY event_name, requestor, troop_number, event_date"
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    @staticmethod
+    def _where(filters):
+        """SQL conditions for event/requestor/troop equality and an event date range"""
+        clauses, params = [], []
+        for name, column in DIMENSIONS.items():
+            if filters.get(name):
+                clauses.append(f"{column} = ?")
+                params.append(filters[name])
+        if filters.get('date_from'):
+            clauses.append('event_date >= ?')
+            params.append(filters['date_from'])
+        if filters.get('date_to'):
+            clauses.append('event_date <= ?')
+            params.append(filters['date_to'])
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def rollup(self, group_by=('event',), **filters):
+        """Totals grouped by any of event, requestor, troop and date, read from the maintained rollups"""
+        columns = [DIMENSIONS[name] for name in group_by]
+        where, params = self._where(filters)
+        select = ', '.join(columns + [f"SUM({measure}) AS {measure}" for measure in MEASURES])
+        query = f"SELECT {select} FROM rollups{where}"
+        if columns:
+            query += f" GROUP BY {', '.join(columns)} ORDER BY {', '.join(columns)}"
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [self._rounded(row) for row in rows if row['submissions']]
+
+    def submissions(self, limit=500, **filters):
+        """Individual submissions, newest event first; limit=None returns every match"""
+        where, params = self._where(filters)
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT id, created_at, requestor, email, troop_number, event_name, event_date, signature_name, "
+                f"report_filename, report_id, purchases, miles, mileage, grand FROM submissions{where} "
+                f"ORDER BY event_date DESC, created_at DESC LIMIT ?",
+                # SQLite reads a negative LIMIT as no limit
+                params + [-1 if limit is None else limit]
+            ).fetchall()
+        return [self._rounded(row) for row in rows]
+
+    def get(self, submission_id):
+        """Full form data, signature and receipt paths of one submission, or None"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT data FROM submissions WHERE id = ?', (submission_id,)).fetchone()
+        return json.loads(row['data']) if row else None
+
+    @staticmethod
+    def _rounded(row):
+        result = dict(row)
+        for measure in ('purchases', 'miles', 'mileage', 'grand'):
+            if measure in result:
+                result[measure] = round(result[measure] or 0, 2)
+        return result
+
+
+def parse_group_by(text):
+    """Turn 'event,requestor' into a tuple of dimension names, rejecting unknown ones"""
+    names = tuple(name.strip() for name in (text or '').split(',') if name.strip())
+    unknown = [name for name in names if name not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown group_by {', '.join(unknown)}; use {', '.join(DIMENSIONS)}")
+    return names
+
+
+def rows_to_csv(rows):
+    """CSV text for a list of result dicts, header taken from the first row"""
+    output = io.StringIO()
+    if rows:
+        writer = csv.DictWriter(output, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return output.getvalue()
@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+
+import hashlib
+import os
+import uuid
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+# Leading bytes of each accepted upload type
+FILE_SIGNATURES = {
+    'pdf': (b'%PDF-',),
+    'jpg': (b'\xff\xd8\xff',),
+    'jpeg': (b'\xff\xd8\xff',),
+    'png': (b'\x89PNG\r\n\x1a\n',),
+    'tiff': (b'II*\x00', b'MM\x00*'),
+}
+SNIFF_BYTES = 8
+
+
+class SpooledUpload:
+    """Writable file part that lands on disk as it arrives, hashing and checking it on the way"""
+
+    def __init__(self, folder, extension, max_bytes, request_budget):
+        self.path = os.path.join(folder, f".{uuid.uuid4()}.upload")
+        self.extension = extension
+        self.max_bytes = max_bytes
+        self.request_budget = request_budget
+        self.size = 0
+        self.detached = False
+        self._digest = hashlib.sha256()
+        self._head = b''
+        self._file = open(self.path, 'w+b')
+
+    def _reject(self, error):
+        self.close()
+        raise error
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self._reject(RequestEntityTooLarge(f"Each file must be under {self.max_bytes // (1024 * 1024)}MB"))
+        self.request_budget.consume(len(data), self)
+
+        if len(self._head) < SNIFF_BYTES:
+            self._head += data[:SNIFF_BYTES - len(self._head)]
+            if len(self._head) >= SNIFF_BYTES and not self.matches_signature():
+                self._reject(UnsupportedMediaType(f"File content is not a valid .{self.extension} file"))
+
+        self._digest.update(data)
+        return self._file.write(data)
+
+    def matches_signature(self):
+        return self._head.startswith(FILE_SIGNATURES[self.extension])
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+    def detach(self):
+        """Hand the spooled file over to the caller; returns (path, sha256)"""
+        if len(self._head) < SNIFF_BYTES and not self.matches_signature():
+            self._reject(UnsupportedMediaType(f"File content is not a valid .{self.extension} file"))
+        self._file.close()
+        self.detached = True
+        return self.path, self.hexdigest()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        if not self.detached and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __getattr__(self, name):
+        # read/seek/tell etc. for FileStorage and anything else that reads the part back
+        return getattr(self._file, name)
+
+
+class RequestBudget:
+    """Bytes of file data still allowed in one request"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.used = 0
+
+    def consume(self, count, upload):
+        self.used += count
+        if self.used > self.max_bytes:
+            upload._reject(RequestEntityTooLarge(f"Uploads must total under {self.max_bytes // (1024 * 1024)}MB"))
+
+
+class StreamingUploadRequest(Request):
+    """Request whose file parts are streamed to disk and checked while the body is read"""
+
+    _upload_budget = None
+    _spools = ()
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if not filename:
+            # File inputs left empty still send a nameless, zero-length part
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        config = current_app.config
+        extension = filename.rsplit('.', 1)[1].lower() if filename and '.' in filename else ''
+        if extension not in config['ALLOWED_EXTENSIONS'] or extension not in FILE_SIGNATURES:
+            # Refuse before a single byte of the file is read
+            raise UnsupportedMediaType(f"File type not allowed: {filename}")
+        if self._upload_budget is None:
+            self._upload_budget = RequestBudget(config['MAX_UPLOAD_REQUEST_BYTES'])
+            self._spools = []
+        spool = SpooledUpload(config['UPLOAD_FOLDER'], extension, config['MAX_UPLOAD_FILE_BYTES'], self._upload_budget)
+        self._spools.append(spool)
+        return spool
+
+    def close(self):
+        super().close()
+        # Parts spooled before a rejection never reach request.files, so remove them here
+        for spool in self._spools:
+            spool.close()
@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+
+import os
+import time
+import zipfile
+
+READ_BYTES = 64 * 1024
+
+
+class _Sink:
+    """Write-only, unseekable file that hands back whatever zipfile wrote since the last drain"""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        # zipfile records entry offsets from this; seek() is absent, so it writes data descriptors
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(entries):
+    """Yield a ZIP archive of entries as it is built, holding at most one read block in memory.
+
+    entries is an iterable of (name, source) where source is a file path or bytes. Nothing is
+    written to disk; sizes and CRCs follow each file in a data descriptor.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, source in entries:
+            if isinstance(source, bytes):
+                info = zipfile.ZipInfo(name, time.localtime()[:6])
+                info.file_size = len(source)
+            else:
+                info = zipfile.ZipInfo.from_file(source, name)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with archive.open(info, 'w') as entry:
+                if isinstance(source, bytes):
+                    entry.write(source)
+                else:
+                    with open(source, 'rb') as f:
+                        for block in iter(lambda: f.read(READ_BYTES), b''):
+                            entry.write(block)
+                            data = sink.drain()
+                            if data:
+                                yield data
+            yield sink.drain()
+    # The central directory is written when the archive closes
+    yield sink.drain()
+
+
+def unique_name(name, taken):
+    """name, or name with _2, _3... before the extension if it is already in taken; records the result"""
+    base, extension = os.path.splitext(name)
+    candidate, n = name, 1
+    while candidate in taken:
+        n += 1
+        candidate = f"{base}_{n}{extension}"
+    taken.add(candidate)
+    return candidate